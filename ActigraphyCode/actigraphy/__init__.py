@@ -0,0 +1,31 @@
+"""
+Actigraphy processing core (the v7 processor) as an importable package.
+
+Submodules load on first attribute access, so ``import actigraphy`` stays cheap and never pulls in
+PyQt5; cv2 and NumPy load only when the processor or the kernels are actually used.
+
+    from actigraphy import ActigraphyProcessor
+    python -m actigraphy --video_folder /path --output_directory /path --name_stamp
+"""
+
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'ActigraphyProcessor': 'actigraphy.processor',
+    'FramePrefetcher': 'actigraphy.reader',
+    'calculate_metrics': 'actigraphy.kernels',
+    'calculate_metrics_fused': 'actigraphy.kernels',
+    'calculate_metrics_multi': 'actigraphy.kernels',
+    'creation_time_from_name': 'actigraphy.timestamps',
+    'NAME_STAMP_FORMATS': 'actigraphy.timestamps',
+    'MOVEMENT_PRESETS': 'actigraphy.presets',
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module 'actigraphy' has no attribute {name!r}")
@@ -0,0 +1,72 @@
+# Startup-time benchmark for the headless entry point. Run from ActigraphyCode:
+# python3 -m actigraphy.bench_startup --target_ms 150
+# Starts fresh interpreters that import actigraphy.cli and build its argument parser (what every SLURM task
+# pays before doing work), reports the median wall time, and exits non-zero if it exceeds the target or if
+# PyQt5, cv2 or NumPy got imported along the way.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+_PROBE = (
+    "import sys\n"
+    "from actigraphy.cli import build_arg_parser\n"
+    "build_arg_parser()\n"
+    "heavy = [m for m in ('PyQt5', 'cv2', 'numpy') if m in sys.modules]\n"
+    "print(','.join(heavy))\n"
+)
+
+def time_headless_startup(runs=10):
+    # Returns (per-run wall times in ms, heavy modules that were imported)
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings_ms = []
+    heavy_modules = set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', _PROBE], cwd=package_parent,
+                                capture_output=True, text=True, check=True)
+        timings_ms.append((time.perf_counter() - start) * 1000)
+        heavy_modules.update(m for m in result.stdout.strip().split(',') if m)
+    return timings_ms, heavy_modules
+
+def time_bare_interpreter(runs=10):
+    # Baseline: an interpreter that imports nothing, so the package's own share can be read off
+    timings_ms = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        timings_ms.append((time.perf_counter() - start) * 1000)
+    return timings_ms
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark headless startup of the actigraphy CLI.')
+    parser.add_argument('--runs', type=int, default=10, help='Interpreter launches per measurement. Default: 10.')
+    parser.add_argument('--target_ms', type=float, default=150.0,
+                        help='Maximum allowed median startup time above a bare interpreter. Default: 150 ms.')
+    args = parser.parse_args(argv)
+
+    baseline_ms = statistics.median(time_bare_interpreter(args.runs))
+    timings_ms, heavy_modules = time_headless_startup(args.runs)
+    median_ms = statistics.median(timings_ms)
+    overhead_ms = median_ms - baseline_ms
+
+    print(f"Bare interpreter startup (median of {args.runs}): {baseline_ms:.1f} ms")
+    print(f"Headless CLI startup (median of {args.runs}): {median_ms:.1f} ms (min {min(timings_ms):.1f}, max {max(timings_ms):.1f})")
+    print(f"Overhead of the actigraphy CLI import: {overhead_ms:.1f} ms (target {args.target_ms:.0f} ms)")
+
+    failed = False
+    if heavy_modules:
+        print(f"FAIL: headless import loaded {', '.join(sorted(heavy_modules))}")
+        failed = True
+    if overhead_ms > args.target_ms:
+        print("FAIL: headless startup is over the target")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
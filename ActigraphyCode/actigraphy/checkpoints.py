@@ -0,0 +1,34 @@
+# Mid-video checkpoints, so a preempted or timed out job resumes a long video instead of restarting it.
+# <name>_actigraphy.csv.checkpoint sits next to a partial output and records the last frame whose row is on disk and the
+# CSV length at that point. Anything after that length is a half written batch and is cut off on resume. A frame-0
+# checkpoint is written before the output is (re)started and the file is removed once the video finishes, so an output
+# without a checkpoint is complete; one still at frame 0 is restarted from the first frame.
+
+import json
+import os
+
+def checkpoint_path(data_csv_path):
+    return data_csv_path + ".checkpoint"
+
+def write_checkpoint(data_csv_path, state):
+    # Atomic replace, so a job killed while writing leaves the previous checkpoint intact
+    path = checkpoint_path(data_csv_path)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump(state, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temp_path, path)
+
+def read_checkpoint(data_csv_path):
+    try:
+        with open(checkpoint_path(data_csv_path), 'r') as checkpoint_file:
+            return json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return None
+
+def remove_checkpoint(data_csv_path):
+    try:
+        os.remove(checkpoint_path(data_csv_path))
+    except FileNotFoundError:
+        pass
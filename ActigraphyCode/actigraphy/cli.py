@@ -0,0 +1,265 @@
+# Command-line entry point. Only argparse and the standard library load at import time; cv2 and NumPy are
+# imported once arguments are parsed, and PyQt5 only when the GUI is requested.
+
+import argparse
+import csv
+import os
+import re
+import sys
+from actigraphy.presets import MOVEMENT_PRESETS
+from actigraphy.rois import load_roi_config
+from actigraphy.shards import check_shards, shard_from_environment
+from actigraphy.timestamps import NAME_STAMP_FORMATS
+
+def load_settings_csv(settings_csv_path):
+    """
+    Reads thresholds and ROI from a Parameter,Value CSV such as a previous run's _MetaData.csv.
+    Returns a dict with any of global_threshold, percentage_threshold, min_size_threshold, dilation_kernel, roi_pts.
+    Raises ValueError for a threshold that is not a number (or not a whole number where the GUI takes an int).
+    """
+    csv_keys = {
+        "Global Threshold": 'global_threshold',
+        "Percentage Threshold": 'percentage_threshold',
+        "Minimum Size Threshold": 'min_size_threshold',
+        "Dilation Kernel": 'dilation_kernel',
+    }
+    settings = {}
+    with open(settings_csv_path, 'r', newline='') as settings_file:
+        for row in csv.reader(settings_file):
+            if len(row) < 2:
+                continue
+            parameter, value = row[0].strip(), row[1].strip()
+            if parameter in csv_keys:
+                try:
+                    number = float(value)
+                except ValueError:
+                    raise ValueError(f"{settings_csv_path}: {parameter} is not a number: {value!r}") from None
+                if csv_keys[parameter] in ('min_size_threshold', 'dilation_kernel'): # Integers, as in the GUI
+                    if not number.is_integer():
+                        raise ValueError(f"{settings_csv_path}: {parameter} must be a whole number: {value!r}")
+                    number = int(number)
+                settings[csv_keys[parameter]] = number
+            elif parameter == "ROI Coordinates (x,y,w,h) Applied":
+                roi_values = re.findall(r'-?\d+', value)
+                if value.startswith('(') and len(roi_values) == 4:
+                    settings['roi_pts'] = tuple(int(v) for v in roi_values)
+    return settings
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='Process actigraphy from video files (headless v7 processor).')
+    parser.add_argument('--video_file', type=str, help='Path to a single video file.')
+    parser.add_argument('--video_folder', type=str, help='Path to a folder containing video files (searched recursively).')
+    parser.add_argument('--output_directory', type=str, help='Output directory for CSV files (default: next to each video).')
+    parser.add_argument('--oaf', action='store_true', help='Override Actigraphy Files.')
+    parser.add_argument('--name_stamp', action='store_true', help='Generate creation time from the video file name.')
+    parser.add_argument('--name_stamp_format', choices=sorted(NAME_STAMP_FORMATS), default='rbb01',
+                        help='File name timestamp layout used with --name_stamp. Default: rbb01.')
+    parser.add_argument('--preset', choices=sorted(MOVEMENT_PRESETS), default='most_movement',
+                        help='Threshold preset (same as the GUI buttons). Default: most_movement.')
+    parser.add_argument('--presets', choices=sorted(MOVEMENT_PRESETS), nargs='+',
+                        help='Evaluate several presets from one decode: each gets its own <video>_<preset>_actigraphy.csv. '
+                             'Uses the preset values as they are (no threshold overrides).')
+    parser.add_argument('--settings_csv', type=str,
+                        help='Parameter,Value CSV (e.g. a previous _MetaData.csv) with thresholds and/or ROI; overrides --preset.')
+    parser.add_argument('--global_threshold', type=float, help='Overrides the preset/settings file value.')
+    parser.add_argument('--percentage_threshold', type=float, help='Overrides the preset/settings file value.')
+    parser.add_argument('--min_size_threshold', type=float, help='Overrides the preset/settings file value.')
+    parser.add_argument('--dilation_kernel', type=int, help='Overrides the preset/settings file value.')
+    roi_group = parser.add_mutually_exclusive_group()
+    roi_group.add_argument('--roi', type=int, nargs=4, metavar=('X', 'Y', 'W', 'H'), help='Region of interest applied to every video.')
+    roi_group.add_argument('--roi_config', type=str,
+                           help='Name,X,Y,W,H CSV of named ROIs (one per cage): each video is decoded once and every ROI '
+                                'gets its own <video>_<name>_actigraphy.csv.')
+    roi_group.add_argument('--roi_profiles', action='store_true',
+                           help='Take each video\'s ROIs from the nearest actigraphy_roi_profile.csv in its folder or a '
+                                'parent folder (saved with --select_rois); videos without one are processed full frame.')
+    parser.add_argument('--select_rois', action='store_true',
+                        help='Only draw ROIs (needs a display) on the first video of every folder without a profile '
+                             'and save them as actigraphy_roi_profile.csv, for later --roi_profiles runs.')
+    parser.add_argument('--overwrite_roi_profiles', action='store_true',
+                        help='With --select_rois, redraw folders that already have a profile.')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count())),
+                        help='Videos processed in parallel in folder mode. Default: SLURM_CPUS_PER_TASK, else all cores.')
+    parser.add_argument('--frame_step', type=int, default=1,
+                        help='Compare each sampled frame with the one frame_step frames later; frames in between are '
+                             'skipped without decoding to color. Default: 1 (every frame pair).')
+    parser.add_argument('--downscale', type=int, default=1,
+                        help='Shrink frames by this integer factor before the metrics (min size threshold and dilation '
+                             'kernel are scaled to match). Default: 1 (full resolution).')
+    parser.add_argument('--full_resolution_units', action='store_true',
+                        help='With --downscale, report RawDifference and SelectedPixelDifference in full-resolution pixels.')
+    parser.add_argument('--decoder', choices=['opencv', 'pyav'], default='opencv',
+                        help='Video decoder: opencv (BGR frames) or pyav (gray frames straight from the codec, needs '
+                             'pip install av). Default: opencv.')
+    parser.add_argument('--decoder_threads', type=int, default=0,
+                        help='Codec threads per video; 0 keeps the decoder default.')
+    parser.add_argument('--segments_per_video', type=int, default=1, help='Frame ranges processed in parallel per video. Default: 1.')
+    parser.add_argument('--prefetch_depth', type=int, default=4, help='Frames decoded ahead on a reader thread (0 disables). Default: 4.')
+    environment_shard_index, environment_shard_count = shard_from_environment()
+    parser.add_argument('--shard_index', type=int, default=environment_shard_index,
+                        help='0-based shard of the folder this job processes. Default: from SLURM_ARRAY_TASK_ID, else 0.')
+    parser.add_argument('--shard_count', type=int, default=environment_shard_count,
+                        help='Number of shards the folder is split into. Default: SLURM_ARRAY_TASK_COUNT, else 1.')
+    parser.add_argument('--merge_shards', action='store_true',
+                        help='Only check that all --shard_count shards of --video_folder finished (exit code 1 if not).')
+    parser.add_argument('--lease_dir', type=str,
+                        help='Shared directory for a lease-file work queue, so several jobs/nodes can work on one folder safely.')
+    parser.add_argument('--lease_seconds', type=float, default=900,
+                        help='Seconds without heartbeat after which a lease is considered crashed and reclaimed. Default: 900.')
+    parser.add_argument('--discovery_threads', type=int, default=8,
+                        help='Directories listed concurrently while discovering videos (helps on NFS). Default: 8.')
+    parser.add_argument('--checkpoint_seconds', type=float, default=120,
+                        help='Minimum seconds between mid-video checkpoints; an interrupted video resumes from its last '
+                             'checkpoint on the next run. 0 disables mid-video checkpoints (interrupted videos restart). Default: 120.')
+    parser.add_argument('--metrics_kernel', choices=['fused', 'float'], default='fused', help='Metric kernel. Default: fused.')
+    parser.add_argument('--strip_rows', type=int, default=0,
+                        help='Run the fused kernel on horizontal strips of this many rows, so its buffers fit in cache '
+                             '(64 suits 4K). Results are identical. Default: 0 (whole frames).')
+    return parser
+
+def run_headless(argv):
+    args = build_arg_parser().parse_args(argv)
+    if not args.video_file and not args.video_folder:
+        print("Please provide either a video file or a video folder.")
+        return 1
+    if args.shard_index is None and args.merge_shards:
+        args.shard_index = 0 # The merge check only needs the count
+    if args.shard_index is None:
+        print("SLURM array is not a contiguous --array=a-b range, so the shard cannot be derived from the task ID; "
+              "pass --shard_index and --shard_count.")
+        return 1
+    if args.shard_count < 1 or not 0 <= args.shard_index < args.shard_count:
+        print(f"Invalid shard {args.shard_index} of {args.shard_count}: --shard_index must be in 0..shard_count-1.")
+        return 1
+    if args.frame_step < 1:
+        print(f"Invalid --frame_step {args.frame_step}: it must be at least 1.")
+        return 1
+    if args.downscale < 1:
+        print(f"Invalid --downscale {args.downscale}: it must be at least 1.")
+        return 1
+    if args.strip_rows < 0:
+        print(f"Invalid --strip_rows {args.strip_rows}: it must be 0 (off) or a number of rows.")
+        return 1
+    if args.strip_rows and args.metrics_kernel != 'fused':
+        print("--strip_rows only applies to the fused metrics kernel.")
+        return 1
+    threshold_overrides = [name for name in ('global_threshold', 'percentage_threshold', 'min_size_threshold', 'dilation_kernel')
+                           if getattr(args, name) is not None]
+    if args.presets and (threshold_overrides or args.settings_csv):
+        print("--presets uses the preset values as they are; drop --settings_csv and the threshold options.")
+        return 1
+    if args.merge_shards:
+        return merge_shards(args.video_folder, args.output_directory, args.shard_count)
+
+    settings = {name: float(value) for name, value in MOVEMENT_PRESETS[args.preset].items()}
+    if args.settings_csv:
+        try:
+            settings.update(load_settings_csv(args.settings_csv))
+        except (OSError, ValueError) as e:
+            print(f"Invalid --settings_csv: {e}")
+            return 1
+    for name in ('global_threshold', 'percentage_threshold', 'min_size_threshold', 'dilation_kernel'):
+        if getattr(args, name) is not None:
+            settings[name] = getattr(args, name)
+    if args.roi:
+        settings['roi_pts'] = tuple(args.roi)
+    named_rois = None
+    if args.roi_config:
+        try:
+            named_rois = load_roi_config(args.roi_config)
+        except (OSError, ValueError) as e:
+            print(f"Invalid --roi_config: {e}")
+            return 1
+        settings.pop('roi_pts', None) # Named ROIs replace a single ROI from --settings_csv
+
+    from actigraphy.processor import ActigraphyProcessor # cv2/NumPy load here, after argument parsing
+
+    processor = ActigraphyProcessor()
+    processor.global_threshold = settings['global_threshold']
+    processor.percentage_threshold = settings['percentage_threshold']
+    processor.min_size_threshold = settings['min_size_threshold']
+    processor.dilation_kernel = int(settings['dilation_kernel'])
+    processor.roi_pts = settings.get('roi_pts')
+    processor.named_rois = named_rois
+    if args.presets:
+        processor.parameter_sets = [(name, {key: float(value) for key, value in MOVEMENT_PRESETS[name].items()})
+                                    for name in dict.fromkeys(args.presets)] # Repeats dropped, order kept
+    processor.roi_profiles = args.roi_profiles
+    processor.metrics_kernel = args.metrics_kernel
+    processor.prefetch_depth = args.prefetch_depth
+    processor.segments_per_video = args.segments_per_video
+    processor.num_workers = args.workers
+    processor.name_stamp_format = args.name_stamp_format
+    processor.lease_dir = args.lease_dir
+    processor.lease_seconds = args.lease_seconds
+    processor.checkpoint_seconds = args.checkpoint_seconds
+    processor.frame_step = args.frame_step
+    processor.decoder = args.decoder
+    processor.decoder_threads = args.decoder_threads
+    processor.downscale = args.downscale
+    processor.full_resolution_units = args.full_resolution_units
+    processor.strip_rows = args.strip_rows
+    processor.discovery_threads = args.discovery_threads
+    # Never prompt for an ROI headless: ROI is on only when coordinates were given
+    set_roi = processor.roi_pts is not None
+
+    if args.select_rois:
+        processor.select_roi_profiles(args.video_file or args.video_folder, args.overwrite_roi_profiles)
+        return 0
+
+    if args.output_directory:
+        os.makedirs(args.output_directory, exist_ok=True)
+    processor.output_file_path = args.output_directory
+
+    if args.video_file:
+        processor.process_single_video_file(args.video_file, args.name_stamp, set_roi, args.output_directory,
+                                            roi_to_apply=processor.roi_pts)
+        processor.generate_metadata_csv(os.path.splitext(os.path.basename(args.video_file))[0], args.video_file,
+                                        set_roi, args.name_stamp, args.output_directory)
+    else:
+        processor.process_video_files(args.video_folder, args.oaf, set_roi, args.name_stamp, args.output_directory,
+                                      shard_index=args.shard_index, shard_count=args.shard_count)
+    return 0
+
+def merge_shards(video_folder, output_directory, shard_count):
+    # Run once after an array job (e.g. as a dependent job) to confirm the whole folder was processed
+    if not video_folder:
+        print("--merge_shards needs --video_folder.")
+        return 1
+    folder_basename = os.path.basename(video_folder.rstrip('/\\'))
+    marker_dir = output_directory if output_directory else video_folder
+    missing_shards, missing_outputs = check_shards(marker_dir, folder_basename, shard_count)
+    for shard_number in missing_shards:
+        print(f"Shard {shard_number} of {shard_count} has not finished (no completion marker in {marker_dir}).")
+    for output_path in missing_outputs:
+        print(f"Listed as done but missing: {output_path}")
+    if missing_shards or missing_outputs:
+        return 1
+    print(f"All {shard_count} shards of {folder_basename} finished.")
+    return 0
+
+def run_gui():
+    # PyQt5 is only imported here so headless runs never load it
+    # os.environ.pop("QT_QPA_PLATFORM_PLUGIN_PATH") # FINALLY FIXED 'xcb' plugin error, only works on Scatha
+    # need to comment out above line of code for macOS
+    from PyQt5.QtWidgets import QApplication
+    from actigraphy.gui import ActigraphyProcessorApp
+    from actigraphy.processor import ActigraphyProcessor
+
+    # Launching the PyQt5 application
+    app = QApplication(sys.argv)
+    
+    actigraphy_processor = ActigraphyProcessor()  # Instantiate the main logic class
+
+    # The ActigraphyProcessorApp now takes the main logic class as an argument
+    window = ActigraphyProcessorApp(actigraphy_processor)
+    window.show()
+
+    return app.exec_()
+
+def main(argv=None):
+    # Any argument runs headless; no arguments opens the GUI
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        return run_headless(argv)
+    return run_gui()
@@ -0,0 +1,126 @@
+# Video decoder backends. Each one offers the part of the cv2.VideoCapture interface the processor uses (isOpened, get,
+# set(CAP_PROP_POS_FRAMES), read, grab, release), so FramePrefetcher and the frame loop work with any of them.
+#   opencv  cv2.VideoCapture, BGR frames (the original path)
+#   pyav    PyAV (optional: pip install av), asks the codec for 8-bit gray frames directly, so there is no YUV->BGR->gray
+#           round trip; optionally with decoder threads and scaling inside the decoder (libswscale, area filter)
+
+import cv2
+
+DECODER_BACKENDS = ('opencv', 'pyav')
+
+class PyAVDecoder:
+    """
+    Gray frames from PyAV. Frames are full-range gray (as cv2.COLOR_BGR2GRAY is), not the raw limited-range Y plane,
+    so thresholds keep their meaning. read() always returns a new array, so the caller may keep a frame as prev_gray.
+    With downscale > 1 the frames come out of the decoder already shrunk by that factor.
+    """
+    reuses_buffers = False # FramePrefetcher need not preallocate frames for this decoder
+
+    def __init__(self, video_file_path, decoder_threads=0, downscale=1):
+        try:
+            import av
+        except ImportError as e:
+            raise ImportError("The pyav decoder needs PyAV: pip install av") from e
+        self._container = None
+        self._pending_frame = None # Frame decoded by set() while seeking, returned by the next read
+        self.downscale = max(1, int(downscale))
+        try:
+            self._container = av.open(video_file_path)
+            self._stream = self._container.streams.video[0]
+        except (av.error.FFmpegError, OSError, IndexError) as e:
+            print(f"PyAV could not open {video_file_path}: {e}")
+            self._container = None
+            return
+        self._stream.thread_type = 'AUTO' # Frame and slice threads inside the codec
+        self._stream.thread_count = max(0, int(decoder_threads)) # 0 lets FFmpeg pick
+        codec_context = self._stream.codec_context
+        self._width, self._height = codec_context.width, codec_context.height
+        self._fps = float(self._stream.average_rate or self._stream.guessed_rate or 0)
+        self._time_base = self._stream.time_base
+        self._start_pts = self._stream.start_time or 0
+        self._frame_count = self._stream.frames
+        if not self._frame_count and self._stream.duration and self._fps:
+            self._frame_count = int(round(float(self._stream.duration * self._time_base) * self._fps))
+        self._frames = self._container.decode(self._stream)
+        self._position_millis = 0.0
+        self._next_index = 0
+
+    def isOpened(self):
+        return self._container is not None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self._frame_count)
+        if prop == cv2.CAP_PROP_FPS:
+            return self._fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._height)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return self._position_millis
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._next_index)
+        return 0.0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES or not self._fps:
+            return False
+        # Seek to the keyframe before the target, then decode forward to it (frame accurate for constant frame rate)
+        frame_index = max(0, int(value))
+        target_pts = self._start_pts + int(round(frame_index / self._fps / self._time_base))
+        self._container.seek(target_pts, backward=True, any_frame=False, stream=self._stream)
+        self._frames = self._container.decode(self._stream)
+        self._pending_frame = None
+        for frame in self._frames:
+            if frame.pts is not None and frame.pts >= target_pts:
+                self._pending_frame = frame
+                break
+        self._next_index = frame_index
+        return self._pending_frame is not None
+
+    def _next_frame(self):
+        frame = self._pending_frame
+        if frame is not None:
+            self._pending_frame = None
+        else:
+            frame = next(self._frames, None)
+        if frame is None:
+            return None
+        self._next_index += 1
+        pts = frame.pts if frame.pts is not None else self._start_pts
+        self._position_millis = (pts - self._start_pts) * float(self._time_base) * 1000 # Same arithmetic as OpenCV
+        return frame
+
+    def grab(self):
+        # Decoded (the codec needs every frame), but never converted
+        return self._next_frame() is not None
+
+    def read(self, buffer=None):
+        frame = self._next_frame()
+        if frame is None:
+            return False, None
+        if self.downscale > 1:
+            frame = frame.reformat(width=self._width // self.downscale, height=self._height // self.downscale,
+                                   format='gray', interpolation='AREA')
+            return True, frame.to_ndarray()
+        return True, frame.to_ndarray(format='gray')
+
+    def release(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+def open_video(video_file_path, backend='opencv', decoder_threads=0, downscale=1):
+    """
+    Opens a video with the given backend. Check isOpened() as with cv2.VideoCapture. downscale is only honoured
+    by backends that can scale while decoding (read the opened decoder's downscale attribute, 1 otherwise).
+    """
+    if backend == 'pyav':
+        return PyAVDecoder(video_file_path, decoder_threads, downscale)
+    if backend != 'opencv':
+        raise ValueError(f"Unknown decoder backend {backend!r}; expected one of {', '.join(DECODER_BACKENDS)}")
+    cap = cv2.VideoCapture(video_file_path)
+    if decoder_threads and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+        cap.set(cv2.CAP_PROP_N_THREADS, int(decoder_threads))
+    return cap
@@ -0,0 +1,53 @@
+# Single-pass discovery of a cohort tree. Every directory is listed exactly once with os.scandir (whose entries carry
+# the file type, so no extra stat per entry), the directories of each tree level are listed concurrently on a thread
+# pool (NFS round trips overlap), and existing outputs are answered from the same listings instead of one lookup each.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+def _scan_directory(directory):
+    # (sorted subdirectory paths, sorted file names); an unreadable directory is reported and treated as empty
+    subdirectories, file_names = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirectories.append(entry.path)
+                    else:
+                        file_names.append(entry.name)
+                except OSError:
+                    continue
+    except OSError as e:
+        print(f"Warning: Could not list {directory}: {e}")
+    return sorted(subdirectories), sorted(file_names)
+
+def scan_tree(root_dir, max_workers=8):
+    """
+    {directory: sorted file names} for root_dir and every directory below it, breadth first in sorted order
+    (the order get_nested_paths always used). The directories of each level are listed concurrently.
+    """
+    listing = {}
+    level = [os.path.normpath(root_dir)]
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        while level:
+            next_level = []
+            for directory, (subdirectories, file_names) in zip(level, executor.map(_scan_directory, level)):
+                listing[directory] = file_names
+                next_level.extend(subdirectories)
+            level = next_level
+    return listing
+
+class OutputIndex:
+    """
+    Existence checks for output files (CSVs, checkpoints) answered from one listing per directory. Seeded with the
+    tree listing when outputs sit next to the videos; any other directory is listed once on its first lookup.
+    """
+    def __init__(self, listing=None):
+        self._names = {os.path.normpath(directory): set(file_names) for directory, file_names in (listing or {}).items()}
+
+    def exists(self, path):
+        directory, name = os.path.split(os.path.normpath(path))
+        if directory not in self._names:
+            self._names[directory] = set(_scan_directory(directory)[1]) if os.path.isdir(directory) else set()
+        return name in self._names[directory]
@@ -0,0 +1,34 @@
+# Per-output fingerprints, so a rerun recomputes only outputs that are stale instead of all (--oaf) or none.
+# <name>_actigraphy.csv.fingerprint is written when a video finishes and records the video (size, mtime) and every
+# setting that shapes its rows. An output whose recorded fingerprint differs from the current one gets redone.
+
+import json
+import os
+
+def fingerprint_path(data_csv_path):
+    return data_csv_path + ".fingerprint"
+
+def write_fingerprint(data_csv_path, fingerprint):
+    path = fingerprint_path(data_csv_path)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as fingerprint_file:
+        json.dump(fingerprint, fingerprint_file, sort_keys=True)
+    os.replace(temp_path, path)
+
+def read_fingerprint(data_csv_path):
+    try:
+        with open(fingerprint_path(data_csv_path), 'r') as fingerprint_file:
+            return json.load(fingerprint_file)
+    except (OSError, ValueError):
+        return None
+
+def remove_fingerprint(data_csv_path):
+    try:
+        os.remove(fingerprint_path(data_csv_path))
+    except FileNotFoundError:
+        pass
+
+def stale_fields(recorded, current, ignore=()):
+    """Names of the fields that differ from the current value or were never recorded (empty when up to date)."""
+    return sorted(key for key in current
+                  if key not in ignore and (key not in recorded or recorded[key] != current[key]))
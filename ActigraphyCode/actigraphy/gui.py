@@ -0,0 +1,274 @@
+# PyQt5 front end for actigraphy.processor.ActigraphyProcessor, kept separate so headless runs never import PyQt5.
+# Started by running actigraphy_v7.py (or python -m actigraphy) without arguments.
+
+import os
+from PyQt5.QtWidgets import QWidget, QLabel, QLineEdit, QPushButton, QFileDialog, QCheckBox, QVBoxLayout
+from PyQt5.QtCore import QThread
+from PyQt5.QtWidgets import QProgressBar
+from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtWidgets import QScrollArea
+from actigraphy.presets import MOVEMENT_PRESETS
+
+class Worker(QThread):
+    progress_signal = pyqtSignal(int)
+
+    def __init__(self, callable, *args, **kwargs):
+        super().__init__()
+        self.callable = callable
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        self.callable(*self.args, **self.kwargs)
+
+class ActigraphyProcessorApp(QWidget):
+    def __init__(self, actigraphy_processor):
+        super().__init__()
+        self.actigraphy_processor = actigraphy_processor
+        self.output_directory = None
+        self.processing_settings_for_metadata = {}
+        # can edit three default settings for buttons
+        self.settings_most_movement = MOVEMENT_PRESETS['most_movement']
+        self.settings_medium_movement = MOVEMENT_PRESETS['medium_movement']
+        self.settings_only_large_movement = MOVEMENT_PRESETS['only_large_movement']
+        self.init_ui()
+
+    def init_ui(self):
+        self.scroll_area = QScrollArea()  # Create a new QScrollArea
+        self.scroll_area.setWidgetResizable(True)
+        layout = QVBoxLayout()
+        # creating buttons for the GUI layout
+        self.video_file_label = QLabel("Video File:")
+        self.video_file_edit = QLineEdit()
+        self.video_file_button = QPushButton("Browse Files")
+        self.video_file_button.clicked.connect(self.browse_video_file)
+
+        self.video_folder_label = QLabel("Video Folder:")
+        self.video_folder_edit = QLineEdit()
+        self.video_folder_button = QPushButton("Browse Folders")
+        self.video_folder_button.clicked.connect(self.browse_video_folder)
+
+        self.min_size_threshold_label = QLabel("Minimum Size Threshold:")
+        self.min_size_threshold_edit = QLineEdit("0")
+
+        self.global_threshold_label = QLabel("Global Threshold:")
+        self.global_threshold_edit = QLineEdit("0")
+
+        self.percentage_threshold_label = QLabel("Percentage Threshold:")
+        self.percentage_threshold_edit = QLineEdit("0")
+
+        self.dilation_kernel_label = QLabel("Dilation Kernel:")
+        self.dilation_kernel_edit = QLineEdit("0")
+
+        self.oaf_check = QCheckBox("Override Actigraphy Files")
+        self.set_roi_check = QCheckBox("Set Region of Interest (ROI)")
+        self.name_stamp_check = QCheckBox("Use Name Stamp")
+        self.name_stamp_check.setChecked(True)
+
+        self.start_button = QPushButton("Start Actigraphy")
+        self.start_button.clicked.connect(self.start_actigraphy)
+
+        self.progress_bar = QProgressBar(self)
+
+        self.btn_most_movement = QPushButton("Most Movement")
+        self.btn_medium_movement = QPushButton("Medium Movement")
+        self.btn_only_large_movement = QPushButton("Only Large Movement")
+
+        self.btn_most_movement.clicked.connect(lambda: self.set_defaults(self.settings_most_movement))
+        self.btn_medium_movement.clicked.connect(lambda: self.set_defaults(self.settings_medium_movement))
+        self.btn_only_large_movement.clicked.connect(lambda: self.set_defaults(self.settings_only_large_movement))
+
+        self.output_directory_label = QLabel("Output CSV File:")
+        self.output_directory_edit = QLineEdit()
+        self.output_directory_button = QPushButton("Select Output File Destination")
+        self.output_directory_button.clicked.connect(self.select_output_file_destination)
+
+        #formally adds all widgets
+        layout.addWidget(self.btn_most_movement)
+        layout.addWidget(self.btn_medium_movement)
+        layout.addWidget(self.btn_only_large_movement)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.video_file_label)
+        layout.addWidget(self.video_file_edit)
+        layout.addWidget(self.video_file_button)
+        layout.addWidget(self.video_folder_label)
+        layout.addWidget(self.video_folder_edit)
+        layout.addWidget(self.video_folder_button)
+        layout.addWidget(self.min_size_threshold_label)
+        layout.addWidget(self.min_size_threshold_edit)
+        layout.addWidget(self.global_threshold_label)
+        layout.addWidget(self.global_threshold_edit)
+        layout.addWidget(self.percentage_threshold_label)
+        layout.addWidget(self.percentage_threshold_edit)
+        layout.addWidget(self.dilation_kernel_label)
+        layout.addWidget(self.dilation_kernel_edit)
+        layout.addWidget(self.oaf_check)
+        layout.addWidget(self.set_roi_check)
+        layout.addWidget(self.name_stamp_check)
+        layout.addWidget(self.start_button)
+        layout.addWidget(self.output_directory_label)
+        layout.addWidget(self.output_directory_edit)
+        layout.addWidget(self.output_directory_button)
+
+        # Create a container widget for the layout
+        container = QWidget()
+        container.setLayout(layout)
+
+        # Set the layout container as the scroll area's widget
+        self.scroll_area.setWidget(container)
+
+        # Create a new layout to hold the scroll area
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(self.scroll_area)
+
+        # Set the main layout for the window
+        self.setLayout(main_layout)
+        self.setWindowTitle('Actigraphy')
+    
+        # Set the minimum width and maximum height of the window
+        self.setMinimumWidth(800)
+        self.setMaximumHeight(600)
+
+    def set_defaults(self, settings):
+        # Update line edits with default values
+        self.global_threshold_edit.setText(settings['global_threshold'])
+        self.percentage_threshold_edit.setText(settings['percentage_threshold'])
+        self.min_size_threshold_edit.setText(settings['min_size_threshold'])
+        self.dilation_kernel_edit.setText(settings['dilation_kernel'])
+    
+    def select_output_file_destination(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        directory = QFileDialog.getExistingDirectory(
+            self,
+            "Select Output Directory",
+            "",  # You can specify a default path here
+            options=options
+        )
+        if directory:
+            # Assuming you want to set the output directory to a class member
+            self.output_directory = directory
+            self.output_directory_edit.setText(directory)
+
+    def browse_video_file(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, 'Open Video File', '', 'MP4 files (*.mp4)')
+        self.video_file_edit.setText(file_name)
+
+    def browse_video_folder(self):
+        dir_name = QFileDialog.getExistingDirectory(self, 'Open Video Folder')
+        self.video_folder_edit.setText(dir_name)
+
+    def start_actigraphy(self):
+        video_file = self.video_file_edit.text()
+        video_folder = self.video_folder_edit.text()
+        
+        user_selected_output_dir = self.output_directory_edit.text().strip() # User's choice from GUI
+
+        try:
+            min_size_threshold = int(self.min_size_threshold_edit.text())
+            global_threshold = int(self.global_threshold_edit.text())
+            percentage_threshold = int(self.percentage_threshold_edit.text())
+            dilation_kernel = int(self.dilation_kernel_edit.text())
+        except ValueError as ve:
+            QMessageBox.warning(self, "Input Error", f"Please enter valid integer values for thresholds and dilation kernel: {ve}")
+            return
+
+        oaf = self.oaf_check.isChecked()
+        set_roi = self.set_roi_check.isChecked()
+        name_stamp = self.name_stamp_check.isChecked()
+
+        self.actigraphy_processor.min_size_threshold = min_size_threshold
+        self.actigraphy_processor.global_threshold = global_threshold
+        self.actigraphy_processor.percentage_threshold = percentage_threshold
+        self.actigraphy_processor.dilation_kernel = dilation_kernel
+        # Clear previous ROI if any, it will be re-determined per run
+        self.actigraphy_processor.roi_pts = None 
+
+
+        self.start_button.setEnabled(False)
+        
+        # Set output path for data CSVs
+        if user_selected_output_dir:
+            self.actigraphy_processor.output_file_path = user_selected_output_dir # Used by process_single_video for data CSV
+        else:
+            self.actigraphy_processor.output_file_path = None
+
+
+        if video_file:
+            self.processing_settings_for_metadata = {
+                'mode': 'single',
+                'input_path': video_file,
+                'base_name': os.path.splitext(os.path.basename(video_file))[0],
+                'user_specified_output_dir': user_selected_output_dir,
+                'set_roi_option': set_roi,
+                'name_stamp_option': name_stamp
+            }
+            # Positional args for process_single_video_file before roi_to_apply and progress_callback:
+            # video_file_path, name_stamp_option, set_roi_user_choice, output_dir_for_data_csv
+            self.worker = Worker(self.actigraphy_processor.process_single_video_file,
+                                 video_file,                 # video_file_path
+                                 name_stamp,                 # name_stamp_option
+                                 set_roi,                    # set_roi_user_choice
+                                 user_selected_output_dir    # output_dir_for_data_csv
+                                 # roi_to_apply will use its default of None
+                                 # progress_callback will be passed via kwargs
+                                )
+            self.worker.kwargs['progress_callback'] = self.worker.progress_signal # Correctly pass as kwarg
+            self.worker.progress_signal.connect(self.update_progress_bar)
+            self.worker.finished.connect(self.on_processing_finished)
+            self.worker.start()
+        elif video_folder:
+            self.processing_settings_for_metadata = {
+                'mode': 'folder',
+                'input_path': video_folder,
+                'base_name': os.path.basename(video_folder.rstrip('/\\')),
+                'user_specified_output_dir': user_selected_output_dir,
+                'set_roi_option': set_roi,
+                'name_stamp_option': name_stamp
+            }
+            # Positional args for process_video_files before progress_callback:
+            # video_folder, oaf, set_roi_option, name_stamp_option, user_specified_output_dir
+            self.worker = Worker(
+                self.actigraphy_processor.process_video_files,
+                video_folder,                 # video_folder
+                oaf,                          # oaf
+                set_roi,                      # set_roi_option
+                name_stamp,                   # name_stamp_option
+                user_selected_output_dir      # user_specified_output_dir
+                # progress_callback will be passed via kwargs
+            )
+            self.worker.kwargs['progress_callback'] = self.worker.progress_signal # Correctly pass as kwarg
+            self.worker.progress_signal.connect(self.update_folder_progress_bar)
+            self.worker.finished.connect(self.on_processing_finished)
+            self.worker.start()
+        else:
+            QMessageBox.information(self, "No Input", "No video file or folder has been selected.")
+            self.start_button.setEnabled(True)
+        
+    def update_progress_bar(self, value):
+        self.progress_bar.setValue(value)
+
+    def update_folder_progress_bar(self, value):
+        self.progress_bar.setValue(value)
+
+    def on_processing_finished(self):
+        self.progress_bar.setValue(100) # Ensure it's 100%
+        QMessageBox.information(self, "Actigraphy Processing", "Actigraphy processing has been completed.")
+        
+        # Generate metadata for single file processing mode
+        if self.processing_settings_for_metadata.get('mode') == 'single':
+            s = self.processing_settings_for_metadata
+            # self.actigraphy_processor.roi_pts will be set (or None if cancelled) 
+            # by the completed process_single_video_file call.
+            # Thresholds are already set on self.actigraphy_processor instance.
+            self.actigraphy_processor.generate_metadata_csv(
+                s['base_name'],
+                s['input_path'],
+                s['set_roi_option'],
+                s['name_stamp_option'],
+                s['user_specified_output_dir']
+            )
+        
+        self.processing_settings_for_metadata = {} # Reset
+        self.start_button.setEnabled(True)
@@ -0,0 +1,371 @@
+# Frame-pair motion kernels. Both return (RawDifference, RMSE, SelectedPixelDifference) for two frames.
+
+from functools import lru_cache
+import cv2
+import numpy as np
+
+# Recorded in every output's fingerprint; bump it when a change to either kernel alters the numbers it produces,
+# so reruns recompute outputs made by the old code instead of skipping them
+KERNEL_VERSION = 1
+
+@lru_cache(maxsize=16)
+def motion_mask_lut(global_threshold, percentage_threshold):
+    # 256x256 table indexed by (prev_gray << 8) | gray holding the combined global/percentage mask value.
+    # Built with the exact float32 math and cv2.threshold calls of calculate_metrics so both kernels agree bit for bit.
+    prev_values = np.repeat(np.arange(256, dtype=np.float32), 256).reshape(256, 256)
+    values = np.tile(np.arange(256, dtype=np.float32), 256).reshape(256, 256)
+    abs_diff = np.abs(values - prev_values)
+    prev_values_safe = prev_values + 1e-5
+    percentage_change = np.abs((values - prev_values_safe) / prev_values_safe)
+    _, abs_diff_mask = cv2.threshold(abs_diff, global_threshold, 255, cv2.THRESH_BINARY)
+    percentage_change_scaled = np.clip(percentage_change * 100, 0, 100).astype(np.uint8)
+    _, percentage_change_mask = cv2.threshold(percentage_change_scaled, percentage_threshold, 255, cv2.THRESH_BINARY)
+    combined = cv2.bitwise_and(abs_diff_mask.astype(np.uint8), percentage_change_mask.astype(np.uint8))
+    return combined.ravel()
+
+@lru_cache(maxsize=16)
+def motion_mask_bits_lut(threshold_pairs):
+    # Up to 8 masks in one table: bit k of entry (prev_gray << 8) | gray is set when the pair passes
+    # threshold_pairs[k] = (global_threshold, percentage_threshold), so one lookup serves every parameter set
+    bits = np.zeros(256 * 256, dtype=np.uint8)
+    for bit, (global_threshold, percentage_threshold) in enumerate(threshold_pairs):
+        bits |= (motion_mask_lut(global_threshold, percentage_threshold) > 0).astype(np.uint8) << bit
+    return bits
+
+@lru_cache(maxsize=16)
+def dilation_kernel(dilation_kernel_size):
+    # Built once per size; callers must not modify it
+    return np.ones((dilation_kernel_size, dilation_kernel_size), np.uint8)
+
+class KernelWorkspace:
+    """
+    Reusable per-video (per-ROI) buffers for the frame loop, handed to OpenCV and NumPy as dst=/out= arguments, so
+    a frame pair allocates nothing frame-sized once the first pair has set the sizes. Buffers are keyed by name and
+    reallocated only if the row width or dtype changes or more rows are needed; a shorter request (the last strip of a
+    tiled frame) gets a view of the first rows. Gray frames alternate between two buffers: the frame returned by
+    next_gray stays valid (as prev_gray) until next_gray is called twice more.
+    """
+    def __init__(self):
+        self._buffers = {}
+        self._gray_turn = 0
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        array = self._buffers.get(name)
+        if array is None or array.shape[1:] != shape[1:] or array.shape[0] < shape[0] or array.dtype != dtype:
+            array = np.empty(shape, dtype)
+            self._buffers[name] = array
+        return array[:shape[0]]
+
+    def next_gray(self, shape):
+        self._gray_turn ^= 1
+        return self.buffer(('gray', self._gray_turn), shape)
+
+    def labels(self, height, width):
+        # connectedComponents output for a box of the frame: a contiguous view of one frame-sized int32 buffer
+        flat_labels = self._buffers.get('labels')
+        if flat_labels is None or flat_labels.size < height * width:
+            flat_labels = np.empty(height * width, np.int32)
+            self._buffers['labels'] = flat_labels
+        return flat_labels[:height * width].reshape(height, width)
+
+def downscaled_shape(shape, downscale):
+    # Output shape of downscale_gray for a frame of this (height, width)
+    return (int(round(shape[0] / downscale)), int(round(shape[1] / downscale)))
+
+def downscale_gray(gray, downscale, dst=None):
+    # Area averaging, so a moving animal keeps its (scaled) footprint instead of aliasing away
+    if downscale <= 1:
+        return gray
+    return cv2.resize(gray, None, dst=dst, fx=1.0 / downscale, fy=1.0 / downscale, interpolation=cv2.INTER_AREA)
+
+def downscaled_parameters(min_size_threshold, dilation_kernel_size, downscale):
+    """
+    (min_size_threshold, dilation_kernel_size) for frames downscaled by the given factor: the minimum component
+    area shrinks with the pixel area (factor squared), the dilation kernel with the side length (at least 1).
+    """
+    if downscale <= 1:
+        return min_size_threshold, dilation_kernel_size
+    if dilation_kernel_size > 0:
+        dilation_kernel_size = max(1, int(round(dilation_kernel_size / downscale)))
+    return min_size_threshold / (downscale * downscale), dilation_kernel_size
+
+def calculate_metrics(frame, prev_frame, global_threshold, min_size_threshold, percentage_threshold, dilation_kernel_size):
+    # Original float32 kernel, kept as the reference the fused kernel is checked against
+    # Ensure frames are grayscale if not already
+    if len(frame.shape) == 3 and frame.shape[2] == 3:
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    else:
+        frame_gray = frame # Assume already grayscale
+
+    if len(prev_frame.shape) == 3 and prev_frame.shape[2] == 3:
+        prev_frame_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
+    else:
+        prev_frame_gray = prev_frame # Assume already grayscale
+
+    abs_diff = np.abs(frame_gray.astype(np.float32) - prev_frame_gray.astype(np.float32))
+    raw_diff = np.sum(abs_diff)
+    rmse = np.sqrt(np.mean(abs_diff ** 2))
+
+    prev_frame_safe = prev_frame_gray.astype(np.float32) + 1e-5
+    percentage_change = np.abs((frame_gray.astype(np.float32) - prev_frame_safe) / prev_frame_safe)
+
+    _, abs_diff_mask = cv2.threshold(abs_diff, global_threshold, 255, cv2.THRESH_BINARY)
+    percentage_change_scaled = np.clip(percentage_change * 100, 0, 100).astype(np.uint8)
+    _, percentage_change_mask = cv2.threshold(percentage_change_scaled, percentage_threshold, 255, cv2.THRESH_BINARY)
+
+    abs_diff_mask = abs_diff_mask.astype(np.uint8)
+    percentage_change_mask = percentage_change_mask.astype(np.uint8)
+    combined_mask = cv2.bitwise_and(abs_diff_mask, percentage_change_mask)
+
+    if dilation_kernel_size > 0:
+        kernel = np.ones((dilation_kernel_size, dilation_kernel_size), np.uint8)
+        dilated_mask = cv2.dilate(combined_mask, kernel, iterations=1)
+    else: # No dilation if kernel size is 0 or less
+        dilated_mask = combined_mask
+
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(dilated_mask, connectivity=8)
+    filtered_mask = np.zeros_like(dilated_mask)
+    if num_labels > 1: # If there are components other than background
+        component_areas = stats[1:, cv2.CC_STAT_AREA]
+        large_components_indices = np.where(component_areas >= min_size_threshold)[0] + 1 # +1 to match label numbers
+        for label_idx in large_components_indices:
+            filtered_mask[labels == label_idx] = 255
+
+    selected_pixel_diff = np.sum(filtered_mask) / 255 # Count of white pixels
+    return raw_diff, rmse, selected_pixel_diff
+
+def calculate_metrics_fused(frame, prev_frame, global_threshold, min_size_threshold, percentage_threshold, dilation_kernel_size,
+                            return_mask=False, counters=None):
+    """
+    Same RawDifference/RMSE/SelectedPixelDifference as calculate_metrics, but stays in uint8:
+    cv2.absdiff for the difference, cv2.norm for the sums and one table lookup for both threshold masks.
+    SelectedPixelDifference is summed from the component areas; the filtered mask is only built
+    (and returned as a fourth value) when return_mask is True.
+    Frame pairs with no pixel passing both thresholds skip dilation and connected components entirely;
+    if a counters dict is given, its 'quiet_frames' entry is incremented for each of them.
+    """
+    if len(frame.shape) == 3 and frame.shape[2] == 3:
+        frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    else:
+        frame_gray = frame # Assume already grayscale
+
+    if len(prev_frame.shape) == 3 and prev_frame.shape[2] == 3:
+        prev_frame_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
+    else:
+        prev_frame_gray = prev_frame # Assume already grayscale
+
+    abs_diff = cv2.absdiff(frame_gray, prev_frame_gray)
+    raw_diff = cv2.norm(abs_diff, cv2.NORM_L1)
+    rmse = cv2.norm(abs_diff, cv2.NORM_L2) / np.sqrt(abs_diff.size)
+
+    # Quiet frame: no pixel clears the global threshold, so every mask below would be empty
+    quiet_frame = cv2.minMaxLoc(abs_diff)[1] <= global_threshold
+    if not quiet_frame:
+        # Both thresholds only depend on the (previous, current) pixel pair, so one lookup gives the combined mask
+        lut_index = prev_frame_gray.astype(np.uint16)
+        lut_index <<= 8
+        lut_index |= frame_gray
+        combined_mask = motion_mask_lut(float(global_threshold), float(percentage_threshold)).take(lut_index)
+        quiet_frame = cv2.countNonZero(combined_mask) == 0
+
+    if quiet_frame:
+        if counters is not None:
+            counters['quiet_frames'] = counters.get('quiet_frames', 0) + 1
+        if return_mask:
+            return raw_diff, rmse, 0, np.zeros_like(abs_diff)
+        return raw_diff, rmse, 0
+
+    labels, (x, y, w, h), component_areas, large_components = _large_components(combined_mask, min_size_threshold,
+                                                                               dilation_kernel_size)
+    selected_pixel_diff = int(component_areas[large_components].sum()) # components are disjoint, so areas add up to the mask count
+
+    if not return_mask:
+        return raw_diff, rmse, selected_pixel_diff
+    label_values = np.zeros(len(component_areas) + 1, dtype=np.uint8)
+    label_values[1:][large_components] = 255
+    filtered_mask = np.zeros_like(abs_diff)
+    filtered_mask[y:y+h, x:x+w] = label_values[labels]
+    return raw_diff, rmse, selected_pixel_diff, filtered_mask
+
+def _large_components(combined_mask, min_size_threshold, dilation_kernel_size, workspace=None, rows=None):
+    """
+    Dilates a non-empty mask (any non-zero value is foreground) and labels its 8-connected components. Only the
+    bounding box of the dilated mask is labelled: labelling the empty rest of the frame is most of the cost when
+    the motion is small. Returns (labels of the box, box as (x, y, w, h), area of each non-background component,
+    area >= min size). With a workspace, the dilated mask and labels go to its buffers.
+    rows=(start, stop) labels only those rows of the dilated mask (a strip without its halo); the box is then
+    relative to start, and labels is None (box (0, 0, 0, 0)) when dilation leaves those rows empty.
+    """
+    if dilation_kernel_size > 0:
+        dilated_mask = cv2.dilate(combined_mask, dilation_kernel(dilation_kernel_size), iterations=1,
+                                  dst=workspace.buffer('dilated', combined_mask.shape) if workspace else None)
+    else: # No dilation if kernel size is 0 or less
+        dilated_mask = combined_mask
+    if rows is not None:
+        dilated_mask = dilated_mask[rows[0]:rows[1]]
+
+    x, y, w, h = cv2.boundingRect(dilated_mask)
+    if w == 0:
+        return None, (0, 0, 0, 0), np.zeros(0, np.int32), np.zeros(0, bool)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(dilated_mask[y:y+h, x:x+w], connectivity=8,
+                                                           labels=workspace.labels(h, w) if workspace else None)
+    component_areas = stats[1:, cv2.CC_STAT_AREA] # exclude the background component
+    return labels, (x, y, w, h), component_areas, component_areas >= min_size_threshold
+
+def _parameter_set_masks(frame_gray, prev_frame_gray, parameter_sets, max_diff, workspace=None):
+    # (set index, combined mask) for each parameter set some pixel of the pair passes. The mask is a workspace
+    # buffer shared by all sets, so it is only valid until the next one is yielded.
+    shape = frame_gray.shape
+    lut_index = None
+    mask_bits = {} # first set index of a group of 8 -> that group's bit-packed masks
+    for set_index, (global_threshold, _, percentage_threshold, _) in enumerate(parameter_sets):
+        if max_diff <= global_threshold: # Quiet for this set's threshold
+            continue
+        if lut_index is None: # Built once, for the first set that needs it
+            lut_index = workspace.buffer('lut_index', shape, np.uint16) if workspace else np.empty(shape, np.uint16)
+            np.left_shift(prev_frame_gray, 8, out=lut_index, dtype=np.uint16)
+            np.bitwise_or(lut_index, frame_gray, out=lut_index)
+        group_start = set_index - set_index % 8
+        if group_start not in mask_bits:
+            threshold_pairs = tuple((float(parameters[0]), float(parameters[2]))
+                                    for parameters in parameter_sets[group_start:group_start + 8])
+            mask_bits[group_start] = motion_mask_bits_lut(threshold_pairs).take(
+                lut_index, out=workspace.buffer(('mask_bits', group_start), shape) if workspace else None)
+        combined_mask = cv2.bitwise_and(mask_bits[group_start], 1 << (set_index - group_start),
+                                        dst=workspace.buffer('combined', shape) if workspace else None)
+        if cv2.countNonZero(combined_mask) > 0:
+            yield set_index, combined_mask
+
+def calculate_metrics_multi(frame_gray, prev_frame_gray, parameter_sets, counters=None, workspace=None, strip_rows=0):
+    """
+    calculate_metrics_fused for several parameter sets in one pass over a gray frame pair. parameter_sets is a
+    sequence of (global_threshold, min_size_threshold, percentage_threshold, dilation_kernel_size). The difference,
+    RawDifference, RMSE and a single bit-packed mask lookup (up to 8 sets per lookup) are shared; only picking the
+    set's mask bit, dilation and component filter run per set. Returns (raw_diff, rmse, [SelectedPixelDifference
+    per set]), each as calculate_metrics_fused gives it.
+    A frame pair counts in counters['quiet_frames'] when it is quiet for every set.
+    With a KernelWorkspace every frame-sized intermediate is written into its buffers instead of allocated.
+    strip_rows > 0 processes frames taller than that in horizontal strips of strip_rows rows, so the intermediates
+    are strip-sized (cache-sized for a few dozen rows of a 4K frame) instead of frame-sized; the results are the same.
+    """
+    if strip_rows > 0 and frame_gray.shape[0] > strip_rows:
+        return _calculate_metrics_multi_strips(frame_gray, prev_frame_gray, parameter_sets, int(strip_rows),
+                                               counters, workspace)
+    abs_diff = cv2.absdiff(frame_gray, prev_frame_gray,
+                           dst=workspace.buffer('abs_diff', frame_gray.shape) if workspace else None)
+    raw_diff = cv2.norm(abs_diff, cv2.NORM_L1)
+    rmse = cv2.norm(abs_diff, cv2.NORM_L2) / np.sqrt(abs_diff.size)
+    max_diff = cv2.minMaxLoc(abs_diff)[1]
+
+    selected_pixel_diffs = [0] * len(parameter_sets)
+    moving_sets = 0
+    for set_index, combined_mask in _parameter_set_masks(frame_gray, prev_frame_gray, parameter_sets, max_diff, workspace):
+        _, min_size_threshold, _, dilation_kernel_size = parameter_sets[set_index]
+        _, _, component_areas, large_components = _large_components(combined_mask, min_size_threshold,
+                                                                    dilation_kernel_size, workspace)
+        selected_pixel_diffs[set_index] = int(component_areas[large_components].sum())
+        moving_sets += 1
+
+    if counters is not None and moving_sets == 0:
+        counters['quiet_frames'] = counters.get('quiet_frames', 0) + 1
+    return raw_diff, rmse, selected_pixel_diffs
+
+class _StripComponents:
+    """
+    Connected components of one parameter set's dilated mask, labelled strip by strip from the top of the frame.
+    Components that touch across a strip border (8-connected, so diagonally too) are joined at the end, so their
+    areas add up to the area the whole-frame labelling gives before the min size filter.
+    """
+    def __init__(self, width):
+        self.width = width
+        self.areas = [np.zeros(1, np.int64)] # index = component id; id 0 is the background
+        self.component_count = 0
+        self.links = [] # (upper id, lower id) arrays of components touching across a strip border
+        self.bottom_row = None # ids along the last row of the previous strip, None if nothing reached it
+
+    def _row_ids(self, label_row, x):
+        row_ids = np.zeros(self.width, np.int64)
+        row_ids[x:x + len(label_row)] = np.where(label_row > 0, label_row.astype(np.int64) + self.component_count, 0)
+        return row_ids
+
+    def add_strip(self, labels, box, component_areas, strip_height):
+        # labels, box and component_areas of the strip as _large_components returns them (labels may be None)
+        x, y, w, h = box
+        if labels is None:
+            self.bottom_row = None
+            return
+        if y == 0 and self.bottom_row is not None:
+            top_row = self._row_ids(labels[0], x)
+            for shift in (-1, 0, 1): # Pixel i of the upper row touches pixels i-1, i and i+1 of the lower one
+                upper = self.bottom_row[max(0, shift):self.width + min(0, shift)]
+                lower = top_row[max(0, -shift):self.width + min(0, -shift)]
+                touching = (upper > 0) & (lower > 0)
+                if touching.any():
+                    self.links.append(np.stack([upper[touching], lower[touching]], axis=1))
+        self.bottom_row = self._row_ids(labels[h - 1], x) if y + h == strip_height else None
+        self.areas.append(component_areas)
+        self.component_count += len(component_areas)
+
+    def skip_strip(self):
+        self.bottom_row = None
+
+    def selected_pixel_diff(self, min_size_threshold):
+        areas = np.concatenate(self.areas)
+        roots = np.arange(len(areas))
+        if self.links:
+            parent = {}
+            def find(node):
+                while parent.get(node, node) != node:
+                    parent[node] = parent.get(parent[node], parent[node]) # Path halving
+                    node = parent[node]
+                return node
+            for upper, lower in np.unique(np.concatenate(self.links), axis=0).tolist():
+                upper_root, lower_root = find(upper), find(lower)
+                if upper_root != lower_root:
+                    parent[max(upper_root, lower_root)] = min(upper_root, lower_root)
+            linked = np.array(sorted(parent))
+            roots[linked] = [find(node) for node in linked.tolist()]
+        merged_areas = np.bincount(roots, weights=areas)
+        return int(merged_areas[1:][merged_areas[1:] >= min_size_threshold].sum())
+
+def _calculate_metrics_multi_strips(frame_gray, prev_frame_gray, parameter_sets, strip_rows, counters=None,
+                                    workspace=None):
+    # calculate_metrics_multi one strip of rows at a time. Each strip is diffed and masked together with a halo of
+    # rows from its neighbours as deep as the largest dilation kernel, so its dilated rows match the whole-frame
+    # dilation; the halo rows are dropped again before labelling. Both sums are integers, so added up strip by strip
+    # they give the whole-frame RawDifference and RMSE exactly.
+    height, width = frame_gray.shape
+    halo = max(0, max(int(parameters[3]) for parameters in parameter_sets))
+    raw_diff = 0.0
+    squared_diff = 0
+    strip_components = [_StripComponents(width) for _ in parameter_sets]
+    moving_sets = set()
+    for start in range(0, height, strip_rows):
+        stop = min(start + strip_rows, height)
+        halo_start, halo_stop = max(0, start - halo), min(height, stop + halo)
+        frame_strip, prev_strip = frame_gray[halo_start:halo_stop], prev_frame_gray[halo_start:halo_stop]
+        abs_diff = cv2.absdiff(frame_strip, prev_strip,
+                               dst=workspace.buffer('abs_diff', frame_strip.shape) if workspace else None)
+        core_diff = abs_diff[start - halo_start:stop - halo_start]
+        raw_diff += cv2.norm(core_diff, cv2.NORM_L1)
+        squared_diff += round(cv2.norm(core_diff, cv2.NORM_L2SQR)) # Returned as a squared norm, a hair off the integer
+
+        labelled_sets = set()
+        for set_index, combined_mask in _parameter_set_masks(frame_strip, prev_strip, parameter_sets,
+                                                             cv2.minMaxLoc(abs_diff)[1], workspace):
+            _, min_size_threshold, _, dilation_kernel_size = parameter_sets[set_index]
+            labels, box, component_areas, _ = _large_components(combined_mask, min_size_threshold, dilation_kernel_size,
+                                                                workspace, rows=(start - halo_start, stop - halo_start))
+            strip_components[set_index].add_strip(labels, box, component_areas, stop - start)
+            labelled_sets.add(set_index)
+        for set_index, components in enumerate(strip_components):
+            if set_index not in labelled_sets:
+                components.skip_strip()
+        moving_sets |= labelled_sets
+
+    if counters is not None and not moving_sets:
+        counters['quiet_frames'] = counters.get('quiet_frames', 0) + 1
+    rmse = np.sqrt(squared_diff) / np.sqrt(frame_gray.size)
+    selected_pixel_diffs = [components.selected_pixel_diff(parameters[1]) if set_index in moving_sets else 0
+                            for set_index, (components, parameters) in enumerate(zip(strip_components, parameter_sets))]
+    return raw_diff, rmse, selected_pixel_diffs
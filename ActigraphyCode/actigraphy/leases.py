@@ -0,0 +1,232 @@
+# Cooperative work queue over a shared (NFS) folder using lease files, so any number of processes on any number
+# of nodes can work through the same cohort without processing a video twice.
+#
+# For each video the lease directory holds at most one of:
+#   <key>.lease  linked into place (so never two at once) by the worker processing it, naming that worker on its
+#                first line and kept fresh by its heartbeat (mtime)
+#   <key>.done   written once the output CSV is complete (then the lease is removed), recording the video's output
+#                fingerprints
+# A .done marker only stops work while it matches: a video whose fingerprints changed (other thresholds, ROI, kernel
+# or video file) or, with --oaf, that was finished before the run started, is claimed and processed again.
+# A lease whose mtime is older than lease_seconds belongs to a crashed worker and is reclaimed by the next worker
+# that finds it. Ages are measured against the file server's clock, not the local one, so node clock skew is harmless.
+# A worker only ever removes a lease that names it, or the very stale file it found; a worker whose lease file stops
+# naming it (or cannot be kept fresh) has lost the video and must stop writing it (LeaseLost).
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+class LeaseLost(Exception):
+    """The lease on a video being processed was taken over or could not be kept fresh; another worker may have it."""
+
+class LeaseQueue:
+    def __init__(self, lease_dir, lease_seconds=900, heartbeat_seconds=60):
+        self.lease_dir = lease_dir
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._owner_tag = self.owner.replace(':', '_') # For file names
+        self._held = set()
+        self._lost = set() # Claimed, but the lease no longer names us
+        self._touched = {} # video -> monotonic time of its last successful heartbeat
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._heartbeat_thread = None
+        os.makedirs(lease_dir, exist_ok=True)
+
+    def _key(self, video_file_path):
+        # Readable and unique even when two folders contain the same file name
+        digest = hashlib.sha1(os.path.abspath(video_file_path).encode('utf-8')).hexdigest()[:12]
+        return f"{os.path.splitext(os.path.basename(video_file_path))[0]}_{digest}"
+
+    def lease_path(self, video_file_path):
+        return os.path.join(self.lease_dir, self._key(video_file_path) + ".lease")
+
+    def done_path(self, video_file_path):
+        return os.path.join(self.lease_dir, self._key(video_file_path) + ".done")
+
+    def is_done(self, video_file_path, fingerprint=None, done_since=None):
+        """
+        True if the video has a .done marker recording this fingerprint (any, if None) and, with done_since (a
+        server_now() time), made no earlier than that. Unreadable markers (older format) do not count.
+        """
+        try:
+            with open(self.done_path(video_file_path), 'r') as done_file:
+                done_record = json.load(done_file)
+                done_mtime = os.fstat(done_file.fileno()).st_mtime
+        except (OSError, ValueError):
+            return False
+        if fingerprint is not None and done_record.get('fingerprint') != fingerprint:
+            return False
+        return done_since is None or done_mtime >= done_since
+
+    def has_lease(self, video_file_path):
+        return os.path.exists(self.lease_path(video_file_path))
+
+    def holds(self, video_file_path):
+        # Claimed by this queue and neither completed, released nor lost yet
+        with self._lock:
+            return video_file_path in self._held
+
+    def check(self, video_file_path):
+        """Raises LeaseLost if the lease on this claimed video was lost; called before each write to its outputs."""
+        with self._lock:
+            lost = video_file_path in self._lost
+        if lost:
+            raise LeaseLost(f"The lease on {os.path.basename(video_file_path)} was lost.")
+
+    def _lose(self, video_file_path, reason):
+        with self._lock:
+            self._held.discard(video_file_path)
+            self._lost.add(video_file_path)
+        print(f"Lost the lease on {os.path.basename(video_file_path)}: {reason}. Its outputs are left to the new holder.")
+
+    @staticmethod
+    def _lease_owner(lease_path):
+        # Owner named on the first line of a lease file, None if there is no such file
+        try:
+            with open(lease_path, 'r') as lease_file:
+                return lease_file.readline().strip()
+        except FileNotFoundError:
+            return None
+
+    def _create_lease(self, lease_path, video_file_path):
+        # Written under our own name and then linked into place: the link fails if a lease exists, and a lease is
+        # never seen without its owner line
+        temp_path = f"{lease_path}.{self._owner_tag}.tmp"
+        with open(temp_path, 'w') as lease_file:
+            lease_file.write(f"{self.owner}\n{video_file_path}\n")
+        try:
+            os.link(temp_path, lease_path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(temp_path)
+
+    def server_now(self):
+        # Current time as the file server sees it: the mtime of a clock file created for the purpose (and removed
+        # again, so workers that are killed leave nothing behind)
+        clock_path = os.path.join(self.lease_dir, f".clock_{self._owner_tag}_{uuid.uuid4().hex[:8]}")
+        with open(clock_path, 'w'):
+            pass
+        try:
+            return os.stat(clock_path).st_mtime
+        finally:
+            os.remove(clock_path)
+
+    def _reclaim_if_stale(self, lease_path):
+        """True if the lease is gone (or was stale and has been removed), so a new claim can be attempted."""
+        try:
+            lease_stat = os.stat(lease_path)
+            stale_owner = self._lease_owner(lease_path)
+        except FileNotFoundError:
+            return True
+        if stale_owner is None:
+            return True
+        lease_age = self.server_now() - lease_stat.st_mtime
+        if lease_age < self.lease_seconds:
+            return False
+        # rename is atomic: only one of several workers finding the same stale lease gets to move it aside
+        stale_path = f"{lease_path}.stale-{self._owner_tag}-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return True
+        # Between the stat and the rename another worker may have reclaimed the stale lease and linked a fresh one
+        # (or the owner's heartbeat touched it); only the very file found stale may be removed
+        moved_stat = os.stat(stale_path)
+        if (self._lease_owner(stale_path) == stale_owner
+                and (moved_stat.st_ino, moved_stat.st_mtime_ns) == (lease_stat.st_ino, lease_stat.st_mtime_ns)):
+            print(f"Reclaiming stale lease {os.path.basename(lease_path)} (no heartbeat for {lease_age:.0f} seconds).")
+            os.remove(stale_path)
+            return True
+        try:
+            os.link(stale_path, lease_path) # Put the live lease back
+            os.remove(stale_path)
+        except FileExistsError:
+            # Yet another worker claimed the free name meanwhile. The displaced lease is not ours to delete; its owner
+            # finds its lease no longer names it at the next heartbeat and gives the video up
+            print(f"Warning: a live lease on {os.path.basename(lease_path)} was displaced to {os.path.basename(stale_path)}.")
+        return False
+
+    def try_claim(self, video_file_path, fingerprint=None, done_since=None):
+        # fingerprint and done_since as for is_done
+        lease_path = self.lease_path(video_file_path)
+        for _ in range(2): # Second attempt only after a stale lease was removed
+            if not self._create_lease(lease_path, video_file_path):
+                if not self._reclaim_if_stale(lease_path):
+                    return False
+                continue
+            if self.is_done(video_file_path, fingerprint, done_since): # Finished by someone else between our check and the claim
+                os.remove(lease_path)
+                return False
+            with self._lock:
+                self._held.add(video_file_path)
+                self._lost.discard(video_file_path)
+                self._touched[video_file_path] = time.monotonic()
+            self._start_heartbeat()
+            return True
+        return False
+
+    def complete(self, video_file_path, fingerprint=None):
+        # Raises LeaseLost (and records nothing) if the lease no longer names this worker
+        lease_path = self.lease_path(video_file_path)
+        self.check(video_file_path)
+        if self._lease_owner(lease_path) != self.owner:
+            self._lose(video_file_path, "its lease now names another worker")
+            self.check(video_file_path)
+        with self._lock:
+            self._held.discard(video_file_path)
+        done_path = self.done_path(video_file_path)
+        temp_path = f"{done_path}.{self._owner_tag}.tmp"
+        with open(temp_path, 'w') as done_file:
+            json.dump({'owner': self.owner, 'video': video_file_path, 'fingerprint': fingerprint}, done_file, sort_keys=True)
+        os.replace(temp_path, done_path)
+        os.remove(lease_path)
+
+    def release(self, video_file_path):
+        # Give a claimed video back unfinished (e.g. processing failed) so another worker can take it
+        with self._lock:
+            self._held.discard(video_file_path)
+        lease_path = self.lease_path(video_file_path)
+        if self._lease_owner(lease_path) == self.owner: # Never someone else's
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+    def _start_heartbeat(self):
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        # Never dies on a file error (ESTALE, EACCES, ENOSPC on NFS): the leases would go stale while processing goes on.
+        # A lease that no longer names us is lost at once, one that cannot be touched for half the lease time too.
+        while not self._stop_event.wait(self.heartbeat_seconds):
+            with self._lock:
+                held = list(self._held)
+            for video_file_path in held:
+                lease_path = self.lease_path(video_file_path)
+                try:
+                    if self._lease_owner(lease_path) != self.owner:
+                        self._lose(video_file_path, "its lease now names another worker")
+                        continue
+                    os.utime(lease_path, None)
+                    with self._lock:
+                        self._touched[video_file_path] = time.monotonic()
+                except OSError as e:
+                    print(f"Lease heartbeat for {os.path.basename(video_file_path)} failed: {e}")
+                    with self._lock:
+                        last_touched = self._touched.get(video_file_path, 0)
+                    if time.monotonic() - last_touched >= self.lease_seconds / 2:
+                        self._lose(video_file_path, "its lease could not be kept fresh")
+
+    def close(self):
+        self._stop_event.set()
@@ -0,0 +1,9 @@
+# Threshold presets shared by the GUI buttons and the --preset option. Kept free of cv2/NumPy so the CLI
+# can build its argument parser without loading them.
+
+# can edit three default settings for the GUI buttons and the --preset option
+MOVEMENT_PRESETS = {
+    'most_movement': {'global_threshold': '15', 'percentage_threshold': '25', 'min_size_threshold': '120', 'dilation_kernel': '4'},
+    'medium_movement': {'global_threshold': '30', 'percentage_threshold': '35', 'min_size_threshold': '160', 'dilation_kernel': '3'},
+    'only_large_movement': {'global_threshold': '40', 'percentage_threshold': '50', 'min_size_threshold': '200', 'dilation_kernel': '2'},
+}
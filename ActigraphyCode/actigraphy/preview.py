@@ -0,0 +1,128 @@
+# Random-access preview of one video for the dilation_v4 tuner. Gray frames sit in an LRU cache that a decoder
+# thread keeps filled ahead of the playhead, so playing, stepping and scrubbing near the playhead never wait on the
+# decoder, and a jump anywhere in a long video costs one seek. Only the displayed frame pair is run through the
+# kernel, again only when the frame or a threshold changes, and the overlay is drawn at preview size.
+
+import threading
+from collections import OrderedDict
+import cv2
+from actigraphy.kernels import calculate_metrics_fused
+
+class PreviewEngine:
+    """
+    Frames are 0-based indices; the pair shown at index i is (i - 1, i), the row with Frame i + 1 in an output CSV.
+    Metrics come from the processor's own kernel, so the numbers shown are the ones processing would write.
+    """
+    def __init__(self, video_path, cache_frames=512, readahead_frames=64, preview_width=960):
+        self.video_path = video_path
+        self.preview_width = preview_width
+        self._cap = cv2.VideoCapture(video_path)
+        self.frame_count = max(0, int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.fps = float(self._cap.get(cv2.CAP_PROP_FPS)) or 30.0
+        self._readahead_frames = max(1, readahead_frames)
+        self._cache_frames = max(cache_frames, 2 * self._readahead_frames) # Room for the readahead plus recent frames
+        self._cache = OrderedDict() # index -> gray frame, least recently used first
+        self._lock = threading.Lock() # Guards the capture, its position and the cache
+        self._wake = threading.Condition(self._lock)
+        self._next_index = 0 # Index the capture decodes next without seeking
+        self._playhead = 0
+        self._closed = False
+        self._shown = None # (index, thresholds, gray, filtered mask, metrics) of the last computed pair
+        self._decoder_thread = None
+        if self._cap.isOpened():
+            self._decoder_thread = threading.Thread(target=self._decode_ahead, daemon=True)
+            self._decoder_thread.start()
+
+    def isOpened(self):
+        return self._cap.isOpened()
+
+    def index_at(self, seconds):
+        return min(max(0, int(round(seconds * self.fps))), max(0, self.frame_count - 1))
+
+    def seconds_at(self, index):
+        return index / self.fps
+
+    def _decode(self, index):
+        # Lock held. Sequential reads are cheap; anything else costs a seek
+        if index != self._next_index:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = self._cap.read()
+        if not ret:
+            self._next_index = -1 # Position unknown, seek next time
+            return None
+        self._next_index = index + 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self._cache[index] = gray
+        while len(self._cache) > self._cache_frames:
+            self._cache.popitem(last=False)
+        return gray
+
+    def gray_frame(self, index):
+        # Gray frame at index (None past the end); also moves the playhead the decoder thread reads ahead of
+        with self._lock:
+            gray = self._cache.get(index)
+            if gray is None:
+                gray = self._decode(index)
+            else:
+                self._cache.move_to_end(index)
+            self._playhead = index
+            self._wake.notify()
+        return gray
+
+    def _next_to_decode(self):
+        # Lock held. First frame after the playhead within the readahead that is not cached yet
+        for index in range(self._playhead + 1, min(self._playhead + 1 + self._readahead_frames, self.frame_count)):
+            if index not in self._cache:
+                return index
+        return None
+
+    def _decode_ahead(self):
+        while True:
+            with self._lock: # Released after every frame, so the UI thread never waits for more than one decode
+                if self._closed:
+                    return
+                index = self._next_to_decode()
+                if index is None:
+                    self._wake.wait()
+                elif self._decode(index) is None:
+                    self._wake.wait() # End of the stream: wait for the playhead to move
+
+    def render(self, index, global_threshold, percentage_threshold, min_size_threshold, dilation_kernel):
+        """
+        (overlay, (RawDifference, RMSE, SelectedPixelDifference)) for the pair ending at index: the frame scaled to
+        at most preview_width wide as BGR, with the selected pixels in green. None if the frame cannot be read.
+        """
+        thresholds = (float(global_threshold), float(percentage_threshold), float(min_size_threshold), int(dilation_kernel))
+        if self._shown is None or self._shown[:2] != (index, thresholds):
+            # Previous frame first: after a jump that is one seek and then a sequential read, and the playhead ends on index
+            prev_gray = self.gray_frame(index - 1) if index > 0 else None
+            gray = self.gray_frame(index)
+            if gray is None:
+                return None
+            if prev_gray is None: # First frame: no pair, nothing selected
+                filtered_mask, metrics = None, (0, 0.0, 0)
+            else:
+                raw_diff, rmse, selected_pixel_diff, filtered_mask = calculate_metrics_fused(
+                    gray, prev_gray, thresholds[0], thresholds[2], thresholds[1], thresholds[3], return_mask=True)
+                metrics = (raw_diff, rmse, selected_pixel_diff)
+            self._shown = (index, thresholds, gray, filtered_mask, metrics)
+        _, _, gray, filtered_mask, metrics = self._shown
+
+        scale = min(1.0, self.preview_width / gray.shape[1])
+        if scale < 1.0:
+            size = (max(1, int(gray.shape[1] * scale)), max(1, int(gray.shape[0] * scale)))
+            gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+            if filtered_mask is not None: # Area then > 0, so a thin selected region still shows at preview size
+                filtered_mask = cv2.resize(filtered_mask, size, interpolation=cv2.INTER_AREA)
+        overlay = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        if filtered_mask is not None:
+            overlay[filtered_mask > 0] = (0, 255, 0)
+        return overlay, metrics
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        if self._decoder_thread is not None:
+            self._decoder_thread.join()
+        self._cap.release()
@@ -0,0 +1,100 @@
+# Persistent index of video header facts (frame count, fps, resolution, duration, filename timestamp), so scheduling,
+# progress and summaries do not open every container again on each run. Entries are keyed by absolute path and only
+# trusted while the video's size and mtime are unchanged.
+
+import csv
+import os
+import uuid
+import cv2
+from actigraphy.timestamps import parse_name_timestamp
+
+PROBE_FIELDS = ['video', 'size', 'mtime', 'frame_count', 'fps', 'width', 'height', 'duration_seconds',
+                'name_stamp_format', 'name_timestamp_ms']
+
+def _parse_record(row):
+    name_timestamp = row['name_timestamp_ms']
+    return {
+        'video': row['video'],
+        'size': int(row['size']),
+        'mtime': float(row['mtime']),
+        'frame_count': int(row['frame_count']),
+        'fps': float(row['fps']),
+        'width': int(row['width']),
+        'height': int(row['height']),
+        'duration_seconds': float(row['duration_seconds']),
+        'name_stamp_format': row['name_stamp_format'],
+        'name_timestamp_ms': int(name_timestamp) if name_timestamp else None,
+    }
+
+def read_probe_index(index_path):
+    records = {}
+    try:
+        with open(index_path, 'r', newline='') as index_file:
+            for row in csv.DictReader(index_file):
+                try:
+                    records[row['video']] = _parse_record(row)
+                except (KeyError, TypeError, ValueError):
+                    continue # Damaged row: that video just gets probed again
+    except FileNotFoundError:
+        pass
+    return records
+
+def probe_video(video_file_path, video_stat=None):
+    # The only place that opens a container for its header
+    video_stat = video_stat or os.stat(video_file_path)
+    frame_count, fps, width, height = 0, 0.0, 0, 0
+    cap = cv2.VideoCapture(video_file_path)
+    if cap.isOpened():
+        frame_count = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        fps = float(cap.get(cv2.CAP_PROP_FPS))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+    return {
+        'video': os.path.abspath(video_file_path),
+        'size': video_stat.st_size,
+        'mtime': video_stat.st_mtime,
+        'frame_count': frame_count,
+        'fps': fps,
+        'width': width,
+        'height': height,
+        'duration_seconds': frame_count / fps if fps > 0 else 0.0,
+        'name_stamp_format': '',
+        'name_timestamp_ms': None,
+    }
+
+class ProbeIndex:
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._records = read_probe_index(index_path)
+        self._updated = {}
+
+    def probe(self, video_file_path, name_stamp_format='rbb01'):
+        """Index record for the video, probing the file only when it is new or changed since it was indexed."""
+        key = os.path.abspath(video_file_path)
+        video_stat = os.stat(key)
+        record = self._records.get(key)
+        if record is None or record['size'] != video_stat.st_size or record['mtime'] != video_stat.st_mtime:
+            record = probe_video(key, video_stat)
+        if record['name_stamp_format'] != name_stamp_format: # Parsing the name is cheap; just redo it
+            record = dict(record, name_stamp_format=name_stamp_format,
+                          name_timestamp_ms=parse_name_timestamp(key, name_stamp_format))
+        if record is not self._records.get(key):
+            self._records[key] = record
+            self._updated[key] = record
+        return record
+
+    def save(self):
+        # Merged into whatever is on disk now, so concurrent shards only ever add to each other's entries
+        if not self._updated:
+            return
+        records = read_probe_index(self.index_path)
+        records.update(self._updated)
+        temp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp" # Unique across hosts sharing the folder, not just pids
+        with open(temp_path, 'w', newline='') as index_file:
+            writer = csv.DictWriter(index_file, fieldnames=PROBE_FIELDS)
+            writer.writeheader()
+            for key in sorted(records):
+                writer.writerow(records[key])
+        os.replace(temp_path, self.index_path)
+        self._updated = {}
@@ -0,0 +1,1098 @@
+# ActigraphyProcessor: per-video frame loop, folder discovery/scheduling and metadata output.
+# Headless; the PyQt5 front end in actigraphy.gui drives the same class.
+
+import cv2
+import csv
+import json
+import sys
+import time
+import os
+from datetime import datetime
+from contextlib import ExitStack
+from functools import partial
+import shutil
+from multiprocessing import Pool, cpu_count
+from actigraphy.checkpoints import checkpoint_path, read_checkpoint, remove_checkpoint, write_checkpoint
+from actigraphy.decoders import open_video
+from actigraphy.discovery import OutputIndex, scan_tree
+from actigraphy.fingerprints import read_fingerprint, remove_fingerprint, stale_fields, write_fingerprint
+from actigraphy.kernels import (KERNEL_VERSION, KernelWorkspace, calculate_metrics, calculate_metrics_multi,
+                                downscale_gray, downscaled_parameters, downscaled_shape)
+from actigraphy.leases import LeaseLost, LeaseQueue
+from actigraphy.probes import ProbeIndex
+from actigraphy.reader import FramePrefetcher
+from actigraphy.rois import ROI_PROFILE_FILENAME, find_roi_profile, load_roi_config, roi_profile_path, save_roi_profile
+from actigraphy.shards import assign_shards, shard_label, write_shard_marker
+from actigraphy.timestamps import creation_time_from_name
+
+def _process_video_segment(processor, video_file_path, rois, creation_time,
+                           start_frame, end_frame, part_csv_paths):
+    # Pool worker for one frame range of a video; rows go to part_csv_paths (one per ROI) and are stitched by the parent
+    cap = processor._open_decoder(video_file_path, rois)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file {video_file_path} for segment starting at frame {start_frame}")
+
+    frame_step = int(processor.frame_step)
+    prev_grays = None
+    if start_frame > 0:
+        # Seek one sampled frame early: the overlap frame is only used as prev_gray for the segment's first diff
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame - frame_step)
+        ret, overlap_frame = cap.read()
+        if ret:
+            prev_grays = processor._to_grays(overlap_frame, rois, getattr(cap, 'downscale', 1))
+
+    frame_counters = {'frame_pairs': 0, 'quiet_frames': 0}
+    with ExitStack() as part_stack:
+        writers = [csv.writer(part_stack.enter_context(open(part_csv_path, 'w', newline='')))
+                   for part_csv_path in part_csv_paths]
+        reader = FramePrefetcher(cap, processor.prefetch_depth, frame_step, skip_before_first=start_frame > 0)
+        try:
+            # frame_number is the 1-based number of the overlap frame; end_frame is the last frame number in range
+            processor._process_frames(reader, rois, processor._metrics_function(frame_counters), creation_time,
+                                      0, writers, frame_counters, prev_grays=prev_grays,
+                                      frame_number=start_frame - frame_step + 1 if start_frame > 0 else 0,
+                                      last_frame_number=end_frame)
+        finally:
+            reader.close()
+    cap.release()
+    return frame_counters
+
+def _process_video_segment_job(segment_job):
+    return _process_video_segment(*segment_job)
+
+_worker_processor = None # Per-process ActigraphyProcessor built once by _init_video_worker
+
+def _init_video_worker(processor_settings):
+    # Pool initializer: builds the worker's processor once instead of pickling it with every task
+    global _worker_processor
+    _worker_processor = ActigraphyProcessor()
+    for name, value in processor_settings.items():
+        setattr(_worker_processor, name, value)
+    _worker_processor.segments_per_video = 1 # Pool workers are daemonic and cannot start their own segment pools
+
+def _process_video_job(job):
+    video_file_path, name_stamp_option, set_roi_option, output_dir_for_data_csv, roi_to_apply = job
+    frame_counters = _worker_processor.process_single_video_file(video_file_path, name_stamp_option, set_roi_option,
+                                                                 output_dir_for_data_csv, roi_to_apply=roi_to_apply)
+    return video_file_path, frame_counters
+
+_worker_lease_queue = None # Per-process LeaseQueue of a lease pool worker, created with its first job
+
+def _lease_queue(processor):
+    return LeaseQueue(processor.lease_dir, processor.lease_seconds, heartbeat_seconds=max(1, processor.lease_seconds / 15))
+
+def _process_leased_video(processor, lease_queue, video_file_path, name_stamp_option, set_roi_option,
+                          output_dir_for_data_csv, roi_to_apply, done_since=None):
+    # Claims and processes one video. Returns (video_file_path, outcome, frame_counters) with outcome 'processed',
+    # 'done' (finished by another worker) or 'leased' (another worker holds it, try again later).
+    # done_since: .done markers older than this server time do not count (--oaf)
+    fingerprint = processor._lease_fingerprint(video_file_path, set_roi_option, name_stamp_option, output_dir_for_data_csv)
+    if lease_queue.is_done(video_file_path, fingerprint, done_since):
+        return video_file_path, 'done', None
+    if not lease_queue.try_claim(video_file_path, fingerprint, done_since):
+        return video_file_path, 'done' if lease_queue.is_done(video_file_path, fingerprint, done_since) else 'leased', None
+    try:
+        frame_counters = processor.process_single_video_file(video_file_path, name_stamp_option, set_roi_option,
+                                                             output_dir_for_data_csv, roi_to_apply=roi_to_apply,
+                                                             abort_check=partial(lease_queue.check, video_file_path))
+        # Also for unreadable videos (None), so nobody retries them until the video or the settings change
+        lease_queue.complete(video_file_path, fingerprint)
+    except LeaseLost as e:
+        print(f"{e} Stopped processing it; the worker holding the lease now finishes it.")
+        return video_file_path, 'leased', None # Offered again later, by when it is done
+    finally:
+        if lease_queue.holds(video_file_path): # Not completed: hand it back so another worker can take it
+            lease_queue.release(video_file_path)
+    return video_file_path, 'processed', frame_counters
+
+def _process_lease_job(job):
+    global _worker_lease_queue
+    if _worker_lease_queue is None:
+        _worker_lease_queue = _lease_queue(_worker_processor)
+    return _process_leased_video(_worker_processor, _worker_lease_queue, *job)
+
+class ActigraphyProcessor:
+    def __init__(self):
+        self.roi_pts = None
+        self.output_file_path = None  # For data CSVs, set by ActigraphyProcessorApp
+        self.min_size_threshold = 0.0
+        self.global_threshold = 0.0
+        self.percentage_threshold = 0.0
+        self.dilation_kernel = 0
+        self.metrics_kernel = 'fused'  # 'fused' (uint8 + lookup table) or 'float' (original float32 kernel)
+        self.prefetch_depth = 4  # Frames decoded ahead on a reader thread; 0 decodes on the processing thread
+        self.decoder = 'opencv'  # Backend in actigraphy.decoders: 'opencv' (BGR) or 'pyav' (gray straight from the codec)
+        self.decoder_threads = 0  # Codec threads per video; 0 keeps the backend default
+        self.frame_step = 1  # Diff frame k against frame k+frame_step; the frames in between are only grabbed
+        self.downscale = 1  # Integer factor frames are shrunk by (INTER_AREA) before the kernel; thresholds follow
+        self.full_resolution_units = False  # Report RawDifference/SelectedPixelDifference scaled back to full resolution
+        self.strip_rows = 0  # >0 runs the fused kernel on horizontal strips of this many rows (same numbers, less memory)
+        self.segments_per_video = 1  # >1 splits each video into frame ranges processed in parallel worker processes
+        self.num_workers = 1  # >1 processes the videos of a folder in a persistent pool, largest first
+        self.name_stamp_format = 'rbb01'  # Key of actigraphy.timestamps.NAME_STAMP_FORMATS used with name stamps
+        self.lease_dir = None  # Shared directory for the lease work queue (folder mode); None processes without leases
+        self.lease_seconds = 900  # A lease without heartbeat for this long belongs to a crashed worker and is reclaimed
+        self.discovery_threads = 8  # Directories listed concurrently per tree level during folder discovery
+        self.checkpoint_seconds = 120  # Minimum wall time between mid-video checkpoints; 0 disables checkpoints and resume
+        self.named_rois = None  # [(name, (x, y, w, h))] from actigraphy.rois: one output per ROI instead of roi_pts
+        self.parameter_sets = None  # [(preset name, thresholds dict)]: one output per set from a single decode and diff
+        self.roi_profiles = False  # Take each video's ROIs from the nearest actigraphy_roi_profile.csv (never prompts)
+        self._roi_profile_cache = {}  # folder -> ROIs of its nearest profile (None without one), per process
+
+    def processing_settings(self):
+        """Attributes a pool worker needs to rebuild an equivalent processor."""
+        return {
+            'min_size_threshold': self.min_size_threshold,
+            'global_threshold': self.global_threshold,
+            'percentage_threshold': self.percentage_threshold,
+            'dilation_kernel': self.dilation_kernel,
+            'metrics_kernel': self.metrics_kernel,
+            'prefetch_depth': self.prefetch_depth,
+            'decoder': self.decoder,
+            'decoder_threads': self.decoder_threads,
+            'frame_step': self.frame_step,
+            'downscale': self.downscale,
+            'full_resolution_units': self.full_resolution_units,
+            'strip_rows': self.strip_rows,
+            'name_stamp_format': self.name_stamp_format,
+            'lease_dir': self.lease_dir,
+            'lease_seconds': self.lease_seconds,
+            'checkpoint_seconds': self.checkpoint_seconds,
+            'roi_pts': self.roi_pts,
+            'named_rois': self.named_rois,
+            'roi_profiles': self.roi_profiles,
+            'parameter_sets': self.parameter_sets,
+        }
+
+    def generate_metadata_csv(self, base_output_name, input_path_str,
+                              user_selected_set_roi_option, user_selected_name_stamp_option,
+                              user_specified_output_dir):
+        """
+        Generates a CSV file containing metadata about the processing run.
+        """
+        actual_save_dir = user_specified_output_dir
+        if not actual_save_dir:  # If user didn't specify an output directory
+            if os.path.isfile(input_path_str):
+                actual_save_dir = os.path.dirname(input_path_str)
+            elif os.path.isdir(input_path_str):
+                actual_save_dir = input_path_str
+            else:
+                print(f"Warning: Could not determine save directory for metadata for {input_path_str}. Skipping metadata file.")
+                return
+
+        if not os.path.exists(actual_save_dir):
+            try:
+                os.makedirs(actual_save_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Error: Could not create directory {actual_save_dir} for metadata CSV: {e}. Skipping.")
+                return
+
+        metadata_filename = f"{base_output_name}_MetaData.csv"
+        metadata_filepath = os.path.join(actual_save_dir, metadata_filename)
+
+        script_name = os.path.basename(sys.argv[0])
+        processing_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        data_to_write = [
+            ("Python Script Name", script_name),
+            ("Processing Settings Applied Time", processing_time),
+            ("Input Path/Identifier", input_path_str),
+            ("Global Threshold", self.global_threshold),
+            ("Percentage Threshold", self.percentage_threshold),
+            ("Minimum Size Threshold", self.min_size_threshold),
+            ("Dilation Kernel", self.dilation_kernel),
+            ("Metrics Kernel", self.metrics_kernel),
+            ("Decoder", self.decoder),
+            ("Frame Step", self.frame_step), # Rows compare frames this many apart (Frame column advances by it)
+            ("Downscale Factor", self.downscale),
+            ("Pixel Units", "Full resolution equivalent" if self.full_resolution_units and self.downscale > 1
+                            else "Analysed resolution"),
+            ("ROI Option Selected by User", user_selected_set_roi_option),
+        ]
+
+        roi_coords_str = "N/A (ROI not selected by user)"
+        if user_selected_set_roi_option:
+            if self.roi_pts and isinstance(self.roi_pts, tuple) and len(self.roi_pts) == 4 and self.roi_pts[2] > 0 and self.roi_pts[3] > 0:
+                roi_coords_str = str(self.roi_pts)
+            elif self.roi_pts:
+                roi_coords_str = f"ROI data recorded: {self.roi_pts} (Check if width/height are > 0 for valid application)"
+            else:
+                roi_coords_str = "User cancelled ROI selection, or selection was invalid/not made"
+
+        data_to_write.append(("ROI Coordinates (x,y,w,h) Applied", roi_coords_str))
+        if self.parameter_sets:
+            data_to_write.append(("Parameter Sets (global/percentage/min size/dilation)", "; ".join(
+                f"{name} {thresholds['global_threshold']}/{thresholds['percentage_threshold']}/"
+                f"{thresholds['min_size_threshold']}/{thresholds['dilation_kernel']}"
+                for name, thresholds in self.parameter_sets)))
+        if self.roi_profiles:
+            data_to_write.append(("ROI Source", f"Per-folder {ROI_PROFILE_FILENAME} (see each output's fingerprint)"))
+        if self.named_rois:
+            data_to_write.append(("Named ROIs (name x y w h)",
+                                  "; ".join(f"{name} {x} {y} {w} {h}" for name, (x, y, w, h) in self.named_rois)))
+        timestamp_source = "Filename Timestamp" if user_selected_name_stamp_option else "File System Metadata Timestamp"
+        data_to_write.append(("Timestamp Source Option", timestamp_source))
+
+        try:
+            with open(metadata_filepath, 'w', newline='') as mf:
+                csv_writer = csv.writer(mf)
+                csv_writer.writerow(["Parameter", "Value"])
+                csv_writer.writerows(data_to_write)
+            print(f"Metadata CSV saved to: {metadata_filepath}")
+        except Exception as e:
+            print(f"Error writing metadata CSV to {metadata_filepath}: {e}")
+
+    def get_nested_paths(self, root_dir):
+        paths = list(scan_tree(root_dir, self.discovery_threads))
+        print('Here are all the nested folders within the selected directory:')
+        for current_dir in paths:
+            print(current_dir) # Keep this print or remove if too verbose
+        return paths
+
+    def list_mp4_files(self, directory_path, output_check_directory, oaf, set_roi_option=False, name_stamp_option=False,
+                       mp4_files=None, output_index=None):
+        # mp4_files/output_index come from _scan_folder; without them the folders are listed here
+        if mp4_files is None:
+            mp4_files = [f for f in os.listdir(directory_path) if f.lower().endswith('.mp4')]
+        # Existing CSVs are looked up in output_check_directory (where data CSVs will go),
+        # which is the source directory_path when no output directory was given.
+
+        updated_mp4_files = []
+        if mp4_files:
+            print(f"List of MP4 files in {directory_path}: ")
+            for mp4_file in mp4_files:
+                print(mp4_file)
+                output_status = self._output_status(os.path.join(directory_path, mp4_file), output_check_directory,
+                                                    set_roi_option, name_stamp_option, output_index)
+                if output_status == 'partial':
+                    print(f"Partial actigraphy file with checkpoint found for {mp4_file}. Resuming this file.")
+                elif output_status.startswith('stale'):
+                    print(f"Actigraphy file for {mp4_file} is out of date ({output_status[len('stale: '):]} changed). Redoing this file.")
+                elif output_status == 'current':
+                    print(f"Actigraphy file already found for {mp4_file} in target output location.")
+                    if oaf:
+                        print("Override Actigraphy Files set True. Redoing this file.")
+                    else:
+                        continue # Skip this file
+                updated_mp4_files.append(mp4_file) # Keep full name, path joining happens later
+            mp4_files = updated_mp4_files
+        else:
+            print(f"No MP4 files found in {directory_path}.")
+        return mp4_files
+
+    def _select_roi_from_first_frame(self, cap):
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        
+        window_name = "Select ROI for Folder/File (ENTER/SPACE to confirm, C/ESC to cancel)"
+        print(f"ROI Selection: Displaying frame. In \"{window_name}\" window, select ROI then press ENTER or SPACE. Press C or ESC to cancel.")
+        # cv2.namedWindow(window_name, cv2.WINDOW_NORMAL) # Optional: make resizable
+        # cv2.resizeWindow(window_name, frame.shape[1]//2, frame.shape[0]//2) # Optional: make smaller
+        
+        roi_coords = cv2.selectROI(window_name, frame, showCrosshair=True, fromCenter=False)
+        cv2.destroyWindow(window_name)
+
+        if roi_coords == (0,0,0,0): # selection cancelled
+            print("ROI selection cancelled by user.")
+            return None
+        return roi_coords
+
+    def _apply_roi(self, frame, roi_pts):
+        x, y, w, h = roi_pts
+        # Ensure ROI coordinates are integers and valid
+        x, y, w, h = int(x), int(y), int(w), int(h)
+        if w > 0 and h > 0:
+             return frame[y:y+h, x:x+w]
+        return frame # Return original frame if ROI is invalid
+
+    @staticmethod
+    def _data_csv_path(video_file_path, output_dir_for_data_csv, output_label=None):
+        # output_label tells apart several outputs of one video (named ROI and/or parameter set)
+        video_name = os.path.splitext(os.path.basename(video_file_path))[0]
+        data_csv_filename = f"{video_name}_{output_label}_actigraphy.csv" if output_label else f"{video_name}_actigraphy.csv"
+        if output_dir_for_data_csv:
+            return os.path.join(output_dir_for_data_csv, data_csv_filename)
+        return os.path.join(os.path.dirname(video_file_path), data_csv_filename)
+
+    def _output_fingerprint(self, video_file_path, roi, name_stamp_option, thresholds=None):
+        # Everything that shapes the rows of a video's output; see actigraphy.fingerprints
+        video_stat = os.stat(video_file_path)
+        thresholds = thresholds or self._parameter_sets()[0][1]
+        return {
+            'video_size': video_stat.st_size,
+            'video_mtime': video_stat.st_mtime,
+            'global_threshold': float(thresholds['global_threshold']),
+            'percentage_threshold': float(thresholds['percentage_threshold']),
+            'min_size_threshold': float(thresholds['min_size_threshold']),
+            'dilation_kernel': int(thresholds['dilation_kernel']),
+            'metrics_kernel': self.metrics_kernel,
+            'kernel_version': KERNEL_VERSION,
+            'frame_step': int(self.frame_step),
+            'downscale': int(self.downscale),
+            'full_resolution_units': bool(self.full_resolution_units),
+            'decoder': self.decoder,
+            'roi': [int(v) for v in roi] if roi else None,
+            'name_stamp_format': self.name_stamp_format if name_stamp_option else None,
+        }
+
+    def _output_status(self, video_file_path, output_dir_for_data_csv, set_roi_option, name_stamp_option,
+                       output_index=None):
+        """
+        'missing', 'partial' (interrupted, has a checkpoint), 'stale: <fields>' (made from another version of the
+        video or with other settings) or 'current'. A run marks every output it starts with a checkpoint before it
+        removes the fingerprint, so a CSV with neither comes from before fingerprints existed and counts as current.
+        With named ROIs or parameter sets the video is only current once every one of its outputs is.
+        """
+        exists = output_index.exists if output_index else os.path.exists
+        roi = self.roi_pts if set_roi_option and not self.named_rois else None
+        # A folder ROI still to be drawn in the GUI is not known yet, so it cannot make an output stale
+        ignore = ('roi',) if set_roi_option and not roi and not self.named_rois and not self.roi_profiles else ()
+        changed = []
+        for data_csv_path, output_roi, thresholds in self._video_outputs(video_file_path, output_dir_for_data_csv, roi):
+            if not exists(data_csv_path):
+                return 'missing'
+            if exists(checkpoint_path(data_csv_path)):
+                return 'partial'
+            recorded = read_fingerprint(data_csv_path)
+            if recorded is None:
+                continue
+            current = self._output_fingerprint(video_file_path, output_roi, name_stamp_option, thresholds)
+            changed.extend(field for field in stale_fields(recorded, current, ignore) if field not in changed)
+        return f"stale: {', '.join(changed)}" if changed else 'current'
+
+    def _scan_folder(self, video_folder, user_specified_output_dir):
+        """
+        One scandir pass over the tree (see actigraphy.discovery). Returns ({folder: sorted mp4 file names}, OutputIndex);
+        outputs next to the videos are answered from the same listing, a separate output directory is listed once.
+        """
+        listing = scan_tree(video_folder, self.discovery_threads)
+        print('Here are all the nested folders within the selected directory:')
+        for folder in listing:
+            print(folder) # Keep this print or remove if too verbose
+        mp4_files_by_folder = {folder: [f for f in file_names if f.lower().endswith('.mp4')]
+                               for folder, file_names in listing.items()}
+        output_index = OutputIndex() if user_specified_output_dir else OutputIndex(listing)
+        return mp4_files_by_folder, output_index
+
+    def _discover_video_files(self, video_folder, oaf, user_specified_output_dir, set_roi_option, name_stamp_option):
+        mp4_files_by_folder, output_index = self._scan_folder(video_folder, user_specified_output_dir)
+        all_mp4_files_to_process = []
+        for current_folder_path, mp4_files in mp4_files_by_folder.items():
+            if not mp4_files:
+                continue
+            # Determine where to check for existing CSVs for list_mp4_files
+            # If user specified an output dir, check there. Otherwise, check in the source folder.
+            dir_to_check_for_csvs = user_specified_output_dir if user_specified_output_dir else current_folder_path
+            
+            mp4_filenames_in_folder = self.list_mp4_files(current_folder_path, dir_to_check_for_csvs, oaf,
+                                                          set_roi_option, name_stamp_option,
+                                                          mp4_files=mp4_files, output_index=output_index)
+            for mp4_filename in mp4_filenames_in_folder:
+                 all_mp4_files_to_process.append(os.path.join(current_folder_path, mp4_filename))
+        return all_mp4_files_to_process
+
+    def _discover_shard(self, video_folder, oaf, user_specified_output_dir, set_roi_option, name_stamp_option,
+                        shard_index, shard_count):
+        """
+        Splits every mp4 under video_folder into shard_count size-balanced shards, ignoring existing outputs so all
+        array tasks agree on the split. Returns (videos assigned to this shard, the ones that still need processing).
+        """
+        mp4_files_by_folder, output_index = self._scan_folder(video_folder, user_specified_output_dir)
+        all_mp4_files = [os.path.join(folder, f) for folder, mp4_files in mp4_files_by_folder.items() for f in mp4_files]
+        assigned = assign_shards(all_mp4_files, shard_count)[shard_index]
+        print(f"Shard {shard_index + 1} of {shard_count}: {len(assigned)} of {len(all_mp4_files)} videos assigned.")
+        to_process = []
+        for mp4_full_path in assigned:
+            if not oaf and self._output_status(mp4_full_path, user_specified_output_dir,
+                                               set_roi_option, name_stamp_option, output_index) == 'current':
+                print(f"Actigraphy file already found for {os.path.basename(mp4_full_path)} in target output location.")
+                continue
+            to_process.append(mp4_full_path)
+        return assigned, to_process
+
+    def _discover_leased(self, video_folder, oaf, user_specified_output_dir, set_roi_option, name_stamp_option):
+        """
+        Videos to offer to the lease queue, and the server time .done markers must be no older than (None without
+        --oaf). oaf and _output_status decide as in the other discovery paths; a .done marker only skips a video when
+        it records the current fingerprints (with --oaf: was made during this run), and a lease next to an output
+        means a worker is still writing it, or crashed half way and the video must be redone.
+        """
+        lease_queue = LeaseQueue(self.lease_dir, self.lease_seconds)
+        done_since = lease_queue.server_now() if oaf else None
+        mp4_files_by_folder, output_index = self._scan_folder(video_folder, user_specified_output_dir)
+        all_mp4_files = [os.path.join(folder, f) for folder, mp4_files in mp4_files_by_folder.items() for f in mp4_files]
+        to_process = [mp4_full_path for mp4_full_path in all_mp4_files
+                      if not lease_queue.is_done(mp4_full_path, self._lease_fingerprint(
+                          mp4_full_path, set_roi_option, name_stamp_option, user_specified_output_dir), done_since)
+                      and (oaf or lease_queue.has_lease(mp4_full_path)
+                           or self._output_status(mp4_full_path, user_specified_output_dir,
+                                                  set_roi_option, name_stamp_option, output_index) != 'current')]
+        print(f"Lease queue {self.lease_dir}: {len(to_process)} of {len(all_mp4_files)} videos still to do.")
+        return to_process, done_since
+
+    def _lease_fingerprint(self, video_file_path, set_roi_option, name_stamp_option, output_dir_for_data_csv):
+        # What a .done marker records: every output of the video with its fingerprint, as JSON reads it back
+        roi = self.roi_pts if set_roi_option and not self.named_rois else None
+        return json.loads(json.dumps(
+            [[data_csv_path, self._output_fingerprint(video_file_path, output_roi, name_stamp_option, thresholds)]
+             for data_csv_path, output_roi, thresholds in self._video_outputs(video_file_path, output_dir_for_data_csv, roi)],
+            sort_keys=True))
+
+    def process_video_files(self, video_folder, oaf, set_roi_option, name_stamp_option,
+                        user_specified_output_dir, progress_callback=None, shard_index=0, shard_count=1):
+        start_time = time.time()
+        total_frames_processed_overall = 0
+        
+        # self.roi_pts is assumed to be cleared by ActigraphyProcessorApp before this call for a new batch
+
+        folder_basename = os.path.basename(video_folder.rstrip('/\\'))
+        lease_done_since = None # Lease queue only: .done markers older than this server time are redone (--oaf)
+        if shard_count > 1:
+            shard_videos, all_mp4_files_to_process = self._discover_shard(video_folder, oaf, user_specified_output_dir,
+                                                                         set_roi_option, name_stamp_option,
+                                                                         shard_index, shard_count)
+            metadata_basename = f"{folder_basename}_{shard_label(shard_index, shard_count)}" # One metadata file per shard
+            if self.lease_dir and oaf: # The shard's videos still go through the lease queue
+                lease_done_since = LeaseQueue(self.lease_dir, self.lease_seconds).server_now()
+        elif self.lease_dir:
+            all_mp4_files_to_process, lease_done_since = self._discover_leased(video_folder, oaf, user_specified_output_dir,
+                                                                               set_roi_option, name_stamp_option)
+            metadata_basename = folder_basename
+        else:
+            all_mp4_files_to_process = self._discover_video_files(video_folder, oaf, user_specified_output_dir,
+                                                                  set_roi_option, name_stamp_option)
+            metadata_basename = folder_basename
+
+        total_files = len(all_mp4_files_to_process)
+        if total_files == 0:
+            print("No video files to process in the selected folder and its subfolders (after checking for overrides).")
+            if progress_callback: progress_callback.emit(100)
+            # Still generate metadata if the folder itself was selected, even if no files found after filtering
+            self.generate_metadata_csv(metadata_basename, video_folder, set_roi_option,
+                                       name_stamp_option, user_specified_output_dir)
+            if shard_count > 1:
+                self._write_shard_marker(video_folder, folder_basename, user_specified_output_dir,
+                                         shard_index, shard_count, shard_videos)
+            return
+
+        if set_roi_option and not self.roi_pts and not self.named_rois and not self.roi_profiles: # Only attempt to set if user wants it and it's not already set
+            first_video_file_for_roi = all_mp4_files_to_process[0]
+            cap_for_roi = cv2.VideoCapture(first_video_file_for_roi)
+            if cap_for_roi.isOpened():
+                print(f"ROI Selection: Opening first video ({os.path.basename(first_video_file_for_roi)}) to select ROI for the folder.")
+                selected_roi_for_folder = self._select_roi_from_first_frame(cap_for_roi)
+                if selected_roi_for_folder and selected_roi_for_folder[2] > 0 and selected_roi_for_folder[3] > 0:
+                    self.roi_pts = selected_roi_for_folder
+                    print(f"ROI for folder set to: {self.roi_pts}")
+                else:
+                    print("ROI selection cancelled or invalid for the folder. Proceeding without applying ROI.")
+                    self.roi_pts = None
+                cap_for_roi.release()
+            else:
+                print(f"Failed to open the first video file for ROI selection: {first_video_file_for_roi}. Proceeding without ROI.")
+                self.roi_pts = None # Ensure it's None
+
+        # Generate metadata CSV for the folder after ROI determination
+        self.generate_metadata_csv(metadata_basename, video_folder, set_roi_option,
+                                   name_stamp_option, user_specified_output_dir)
+
+        video_probes = self._probe_videos(all_mp4_files_to_process, video_folder, folder_basename, user_specified_output_dir)
+        total_frames_to_process = sum(probe['frame_count'] for probe in video_probes.values())
+        total_video_seconds = 0.0
+
+        files_processed_count = 0
+        total_frame_pairs = 0
+        total_quiet_frames = 0
+        for mp4_full_path, frame_counters in self._iter_processed_videos(all_mp4_files_to_process, name_stamp_option,
+                                                                         set_roi_option, user_specified_output_dir,
+                                                                         video_probes, lease_done_since):
+            if frame_counters:
+                total_frame_pairs += frame_counters['frame_pairs']
+                total_quiet_frames += frame_counters['quiet_frames']
+
+            files_processed_count += 1
+            total_frames_processed_overall += video_probes[mp4_full_path]['frame_count'] # From the index, no reopen
+            total_video_seconds += video_probes[mp4_full_path]['duration_seconds']
+
+            if progress_callback: # Weighted by frames, so one long video does not stall the bar at the end
+                if total_frames_to_process:
+                    folder_progress = int((total_frames_processed_overall / total_frames_to_process) * 100)
+                else:
+                    folder_progress = int((files_processed_count / total_files) * 100)
+                progress_callback.emit(folder_progress)
+        
+        end_time = time.time()
+        total_time_taken = end_time - start_time
+        time_per_frame = total_time_taken / total_frames_processed_overall if total_frames_processed_overall else float('inf')
+        print("\n--- FOLDER PROCESSING SUMMARY ---")
+        print(f"Total Videos Processed: {files_processed_count}")
+        print(f"Total Time Taken for All Videos: {total_time_taken:.2f} seconds")
+        print(f"Total Frames Processed for All Videos: {total_frames_processed_overall}")
+        print(f"Average Time Per Frame for All Videos: {time_per_frame:.4f} seconds")
+        if total_video_seconds and total_time_taken:
+            print(f"Video Duration Processed: {total_video_seconds / 3600:.2f} hours ({total_video_seconds / total_time_taken:.1f}x real time)")
+        if self.metrics_kernel == 'fused':
+            quiet_share = (total_quiet_frames / total_frame_pairs) * 100 if total_frame_pairs else 0
+            print(f"Quiet Frame Pairs (fast path): {total_quiet_frames} of {total_frame_pairs} ({quiet_share:.1f}%)")
+        print("-" * 30)
+
+        if shard_count > 1:
+            self._write_shard_marker(video_folder, folder_basename, user_specified_output_dir,
+                                     shard_index, shard_count, shard_videos)
+
+        if progress_callback:
+            progress_callback.emit(100)
+
+    def _write_shard_marker(self, video_folder, folder_basename, user_specified_output_dir,
+                            shard_index, shard_count, shard_videos):
+        marker_dir = user_specified_output_dir if user_specified_output_dir else video_folder
+        roi = self.roi_pts if not self.named_rois else None # Only the names matter for the output paths
+        video_outputs = [(video, data_csv_path) for video in shard_videos
+                         for data_csv_path, _, _ in self._video_outputs(video, user_specified_output_dir, roi)]
+        write_shard_marker(marker_dir, folder_basename, shard_index, shard_count, video_outputs)
+
+    def _probe_videos(self, video_file_paths, video_folder, folder_basename, user_specified_output_dir):
+        """
+        Header facts for each video from the folder's probe index (<folder>_ProbeIndex.csv next to the metadata),
+        opening only videos that are new or changed since the last run. Returns {video_file_path: probe record}.
+        """
+        index_dir = user_specified_output_dir if user_specified_output_dir else video_folder
+        probe_index = ProbeIndex(os.path.join(index_dir, f"{folder_basename}_ProbeIndex.csv"))
+        video_probes = {path: probe_index.probe(path, self.name_stamp_format) for path in video_file_paths}
+        probe_index.save()
+        return video_probes
+
+    @staticmethod
+    def _largest_first(video_file_paths, video_probes):
+        # Scheduling order: header frame count, file size as tie-breaker/fallback
+        return sorted(video_file_paths, key=lambda path: (video_probes[path]['frame_count'], video_probes[path]['size']),
+                      reverse=True)
+
+    def _iter_processed_videos(self, video_file_paths, name_stamp_option, set_roi_option, output_dir_for_data_csv,
+                               video_probes, lease_done_since=None):
+        """
+        Processes the videos and yields (video_file_path, frame_counters) as each one finishes.
+        With num_workers > 1 the videos are sorted largest first (by their probes) and streamed back from a
+        persistent pool so a big file never starts last while the other workers sit idle.
+        """
+        if self.lease_dir:
+            yield from self._iter_leased_videos(self._largest_first(video_file_paths, video_probes), name_stamp_option,
+                                                set_roi_option, output_dir_for_data_csv, lease_done_since)
+            return
+
+        if int(self.num_workers) <= 1 or len(video_file_paths) <= 1:
+            for video_file_path in video_file_paths:
+                # roi_to_apply is self.roi_pts (the one potentially set for the folder)
+                yield video_file_path, self.process_single_video_file(video_file_path, name_stamp_option, set_roi_option,
+                                                                      output_dir_for_data_csv, roi_to_apply=self.roi_pts)
+            return
+
+        video_file_paths = self._largest_first(video_file_paths, video_probes)
+        # Workers must never prompt for an ROI, so only ask them to apply one that has already been selected
+        apply_roi = bool(set_roi_option and self.roi_pts)
+        jobs = [(video_file_path, name_stamp_option, apply_roi, output_dir_for_data_csv, self.roi_pts)
+                for video_file_path in video_file_paths]
+        num_processes = min(int(self.num_workers), len(jobs), cpu_count())
+        print(f"Processing {len(jobs)} videos with {num_processes} workers, largest first.")
+        with Pool(processes=num_processes, initializer=_init_video_worker,
+                  initargs=(self.processing_settings(),)) as pool:
+            for video_file_path, frame_counters in pool.imap_unordered(_process_video_job, jobs, chunksize=1):
+                yield video_file_path, frame_counters
+
+    def _iter_leased_videos(self, video_file_paths, name_stamp_option, set_roi_option, output_dir_for_data_csv,
+                            done_since=None):
+        """
+        Every local worker (and every other process on any node) claims from the same lease directory, one video per
+        job in the given (largest first) order; yields (video_file_path, frame_counters) as each one finishes.
+        Videos leased elsewhere are offered again every heartbeat interval (so the leases of workers that crash
+        meanwhile get reclaimed) until they are done. done_since is passed on to _process_leased_video.
+        """
+        apply_roi = bool(set_roi_option and self.roi_pts)
+        jobs = {video_file_path: (video_file_path, name_stamp_option, apply_roi, output_dir_for_data_csv, self.roi_pts,
+                                  done_since)
+                for video_file_path in video_file_paths}
+        with ExitStack() as lease_stack:
+            if int(self.num_workers) <= 1 or len(video_file_paths) <= 1:
+                lease_queue = _lease_queue(self)
+                lease_stack.callback(lease_queue.close)
+                def run_jobs(pending_jobs):
+                    return (_process_leased_video(self, lease_queue, *job) for job in pending_jobs)
+            else:
+                num_processes = min(int(self.num_workers), len(video_file_paths), cpu_count())
+                print(f"Claiming videos from the lease queue with {num_processes} workers.")
+                pool = lease_stack.enter_context(Pool(processes=num_processes, initializer=_init_video_worker,
+                                                      initargs=(self.processing_settings(),)))
+                def run_jobs(pending_jobs):
+                    return pool.imap_unordered(_process_lease_job, pending_jobs, chunksize=1)
+            pending = list(video_file_paths)
+            while pending:
+                leased_elsewhere = set()
+                for video_file_path, outcome, frame_counters in run_jobs([jobs[path] for path in pending]):
+                    if outcome == 'processed':
+                        yield video_file_path, frame_counters
+                    elif outcome == 'leased':
+                        leased_elsewhere.add(video_file_path)
+                pending = [path for path in pending if path in leased_elsewhere]
+                if pending:
+                    print(f"Waiting on {len(pending)} videos leased by other workers.")
+                    time.sleep(max(1, self.lease_seconds / 15))
+
+    def process_single_video_file(self, video_file_path, name_stamp_option, set_roi_user_choice,
+                              output_dir_for_data_csv, roi_to_apply=None, progress_callback=None, abort_check=None):
+        # abort_check() is called before every write to the outputs and may raise to stop the video there
+        # (the lease queue's LeaseQueue.check, so a worker that lost its lease never writes to the new holder's files)
+        if name_stamp_option: # Simplified from original (name_stamp or name_stamp is None)
+            creation_time = creation_time_from_name(video_file_path, self.name_stamp_format)
+        else:
+            creation_time = int(os.path.getctime(video_file_path) * 1000)
+
+        # Determine actual ROI to use for this file.
+        # self.roi_pts is the instance's current ROI state.
+        # For a true single file run (not part of batch), roi_to_apply would be None.
+        # ActigraphyProcessorApp clears self.roi_pts before a run.
+        # Named ROIs (self.named_rois) and ROI profiles replace the single ROI entirely and are never prompted for.
+        current_file_roi = None
+        if set_roi_user_choice and not self.named_rois and not self.roi_profiles:
+            if roi_to_apply and roi_to_apply[2] > 0 and roi_to_apply[3] > 0: # Valid ROI passed from folder context
+                current_file_roi = roi_to_apply
+                self.roi_pts = current_file_roi # Ensure instance reflects this
+            elif not roi_to_apply and self.roi_pts is None: # True single file, needs ROI selection
+                print(f"ROI Selection: Opening video ({os.path.basename(video_file_path)}) to select ROI.")
+                # A separate OpenCV capture: selectROI needs a BGR frame whatever the decoder backend is
+                temp_cap_for_roi = cv2.VideoCapture(video_file_path)
+                if temp_cap_for_roi.isOpened():
+                    selected_roi = self._select_roi_from_first_frame(temp_cap_for_roi)
+                    if selected_roi and selected_roi[2] > 0 and selected_roi[3] > 0:
+                        self.roi_pts = selected_roi # This sets it for the App to pick up later for single file metadata
+                        current_file_roi = self.roi_pts
+                    else:
+                        self.roi_pts = None # Explicitly None if cancelled/invalid
+                        current_file_roi = None
+                    temp_cap_for_roi.release()
+                else:
+                    print(f"Could not open video {video_file_path} to select ROI.")
+                    self.roi_pts = None
+                    current_file_roi = None
+            elif self.roi_pts and self.roi_pts[2] > 0 and self.roi_pts[3] > 0: # ROI already set on instance (e.g. by previous single file)
+                 current_file_roi = self.roi_pts
+
+        # One output per ROI and parameter set: the classic single output, or one per named ROI and/or preset,
+        # all from the same decoded frames
+        rois = [roi for _, roi in self._video_rois(video_file_path, current_file_roi)]
+        video_outputs = self._video_outputs(video_file_path, output_dir_for_data_csv, current_file_roi)
+        data_csv_paths = [data_csv_path for data_csv_path, _, _ in video_outputs]
+
+        # Opened once the ROI is known: decoders that scale while decoding only do so for full frames
+        cap = self._open_decoder(video_file_path, rois)
+        if not cap.isOpened():
+            print(f"Error: Could not open video file {video_file_path}")
+            if progress_callback: progress_callback.emit(100) # Mark as done if error
+            return
+
+        frame_counters = {'frame_pairs': 0, 'quiet_frames': 0}
+        calculate_metrics = self._metrics_function(frame_counters)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        num_segments = min(int(self.segments_per_video), total_frames // 2) if total_frames > 0 else 1
+
+        output_fingerprints = [self._output_fingerprint(video_file_path, roi, name_stamp_option, thresholds)
+                               for _, roi, thresholds in video_outputs]
+        checkpoint_states = [dict(output_fingerprint, creation_time=creation_time)
+                             for output_fingerprint in output_fingerprints]
+        if abort_check: abort_check()
+        resume_frame = self._prepare_resume(data_csv_paths, checkpoint_states)
+        if resume_frame:
+            num_segments = 1 # The rest of a resumed video is read as one stream
+        else:
+            # Frame-0 checkpoint before the outputs are truncated: a run cut off before its first real checkpoint
+            # (segmented runs and checkpoint_seconds 0 never write one) leaves outputs a rerun sees as partial
+            for data_csv_full_path, checkpoint_state in zip(data_csv_paths, checkpoint_states):
+                write_checkpoint(data_csv_full_path, dict(checkpoint_state, frame_number=0, csv_bytes=0))
+        # Only once the checkpoint marks them as in progress: an output never has neither file while it is rewritten
+        for data_csv_full_path in data_csv_paths:
+            remove_fingerprint(data_csv_full_path) # Until it is rewritten below, the output is not known to be complete
+
+        print(f"\nProcessing video file: {video_file_path}")
+        named_rois = self._named_rois(video_file_path)
+        if named_rois:
+            print(f"Applying {len(named_rois)} named ROIs: {', '.join(name for name, _ in named_rois)}")
+        elif rois[0]:
+            print(f"Applying ROI: {rois[0]}")
+        else:
+            print("Processing full frame (no ROI or ROI invalid/cancelled).")
+
+        with ExitStack() as output_stack:
+            output_files = [output_stack.enter_context(open(data_csv_full_path, 'a' if resume_frame else 'w', newline=''))
+                            for data_csv_full_path in data_csv_paths]
+            writers = [csv.writer(output_file) for output_file in output_files]
+            if not resume_frame:
+                for writer in writers:
+                    writer.writerow(['Frame', 'TimeElapsedMicros', 'RawDifference', 'RMSE', 'SelectedPixelDifference', 'POSIX'])
+                    writer.writerow([0, 0, 0, 0, 0, creation_time]) # Initial state row
+
+            if num_segments > 1:
+                cap.release() # Each segment worker opens its own capture
+                print(f"Splitting into {num_segments} segments of about {total_frames // num_segments} frames each.")
+                for output_file in output_files:
+                    output_file.flush()
+                frame_counters = self._process_segments(video_file_path, rois, creation_time, total_frames,
+                                                        num_segments, data_csv_paths, output_files, progress_callback,
+                                                        abort_check)
+            else:
+                prev_grays = self._seek_for_resume(cap, resume_frame, rois) if resume_frame else None
+                on_flush = None
+                if self.checkpoint_seconds > 0:
+                    on_flush = self._checkpoint_writer(output_files, data_csv_paths, checkpoint_states)
+                reader = FramePrefetcher(cap, self.prefetch_depth, self.frame_step, skip_before_first=resume_frame > 0)
+                try:
+                    self._process_frames(reader, rois, calculate_metrics, creation_time,
+                                         total_frames, writers, frame_counters, progress_callback,
+                                         prev_grays=prev_grays, frame_number=resume_frame, on_flush=on_flush,
+                                         abort_check=abort_check)
+                finally:
+                    reader.close()
+        if abort_check: abort_check()
+        for data_csv_full_path, output_fingerprint in zip(data_csv_paths, output_fingerprints):
+            write_fingerprint(data_csv_full_path, output_fingerprint) # Only reached once every row is written
+            remove_checkpoint(data_csv_full_path)
+
+        cap.release()
+        if progress_callback: progress_callback.emit(100) # Ensure completion
+        for data_csv_full_path in data_csv_paths:
+            print(f"Actigraphy data CSV saved to {data_csv_full_path}")
+        if self.metrics_kernel == 'fused':
+            print(f"Quiet frame pairs (fast path): {frame_counters['quiet_frames']} of {frame_counters['frame_pairs']}")
+        print("-" * 75)
+        return frame_counters
+
+    def _video_rois(self, video_file_path, current_file_roi):
+        # [(ROI name, ROI)] cropped from each frame of the video: the named ROIs, or just (None, the single ROI or None)
+        named_rois = self._named_rois(video_file_path)
+        if named_rois:
+            return named_rois
+        if self.roi_profiles:
+            profile_rois = self._profile_rois(video_file_path)
+            current_file_roi = profile_rois[0][1] if profile_rois else None
+        return [(None, current_file_roi)]
+
+    def _parameter_sets(self):
+        # [(preset name, thresholds)] each frame pair is evaluated with; (None, the instance thresholds) without presets
+        if self.parameter_sets:
+            return self.parameter_sets
+        return [(None, {'global_threshold': self.global_threshold, 'percentage_threshold': self.percentage_threshold,
+                        'min_size_threshold': self.min_size_threshold, 'dilation_kernel': self.dilation_kernel})]
+
+    def _video_outputs(self, video_file_path, output_dir_for_data_csv, current_file_roi):
+        """
+        [(data CSV path, ROI, thresholds)] for one video, ROI by ROI and within each ROI in parameter set order (the
+        order _process_frames writes them in): <name>_actigraphy.csv, or <name>_<roi name>_<preset>_actigraphy.csv
+        with the parts that apply.
+        """
+        video_outputs = []
+        for roi_name, roi in self._video_rois(video_file_path, current_file_roi):
+            for preset_name, thresholds in self._parameter_sets():
+                output_label = "_".join(part for part in (roi_name, preset_name) if part)
+                video_outputs.append((self._data_csv_path(video_file_path, output_dir_for_data_csv, output_label),
+                                      roi, thresholds))
+        return video_outputs
+
+    def _named_rois(self, video_file_path):
+        # --roi_config ROIs apply to every video; a profile only gives named outputs when it holds several ROIs
+        if self.named_rois:
+            return self.named_rois
+        profile_rois = self._profile_rois(video_file_path)
+        return profile_rois if profile_rois and len(profile_rois) > 1 else None
+
+    def _profile_rois(self, video_file_path):
+        # ROIs of the nearest profile for this video, None if ROI profiles are off or no folder up the tree has one
+        if not self.roi_profiles:
+            return None
+        folder = os.path.dirname(os.path.abspath(video_file_path))
+        if folder not in self._roi_profile_cache:
+            profile_path = find_roi_profile(folder)
+            if profile_path is None:
+                print(f"Warning: No {ROI_PROFILE_FILENAME} for {folder} or its parents; processing its videos full frame.")
+                self._roi_profile_cache[folder] = None
+            else:
+                try:
+                    self._roi_profile_cache[folder] = load_roi_config(profile_path)
+                except ValueError as e:
+                    print(f"Error: Invalid ROI profile: {e}")
+                    raise
+        return self._roi_profile_cache[folder]
+
+    def select_roi_profiles(self, video_path, overwrite=False):
+        """
+        One-time interactive step (needs a display): for every folder with videos under video_path (or the folder of a
+        single video), draws ROIs on the first frame of its first video and saves them as the folder's ROI profile.
+        Several boxes give named ROIs roi1, roi2, ...; cancelling leaves the folder to the nearest parent profile.
+        Folders that already have a profile are kept unless overwrite is set. Later runs with roi_profiles need no display.
+        """
+        if os.path.isfile(video_path):
+            folders = {os.path.dirname(os.path.abspath(video_path)): [os.path.basename(video_path)]}
+        else:
+            folders = scan_tree(video_path, self.discovery_threads)
+        for folder, file_names in folders.items():
+            mp4_files = [f for f in file_names if f.lower().endswith('.mp4')]
+            if not mp4_files:
+                continue
+            profile_path = roi_profile_path(folder)
+            if os.path.exists(profile_path) and not overwrite:
+                print(f"ROI profile already found for {folder}; keeping it.")
+                continue
+            cap_for_roi = cv2.VideoCapture(os.path.join(folder, mp4_files[0]))
+            if not cap_for_roi.isOpened():
+                print(f"Failed to open {mp4_files[0]} for ROI selection; no profile saved for {folder}.")
+                continue
+            print(f"ROI Selection: Opening {mp4_files[0]} to select the ROIs for {folder}.")
+            ret, frame = cap_for_roi.read()
+            cap_for_roi.release()
+            if not ret:
+                print(f"Could not read a frame of {mp4_files[0]}; no profile saved for {folder}.")
+                continue
+            window_name = "Select ROIs for folder (ENTER/SPACE after each box, ESC when done)"
+            rois = [tuple(int(v) for v in roi) for roi in cv2.selectROIs(window_name, frame, showCrosshair=True, fromCenter=False)]
+            cv2.destroyWindow(window_name)
+            rois = [roi for roi in rois if roi[2] > 0 and roi[3] > 0]
+            if not rois:
+                print(f"No ROI selected; {folder} uses the nearest parent folder's profile, if any.")
+                continue
+            names = ['roi'] if len(rois) == 1 else [f"roi{index + 1}" for index in range(len(rois))]
+            save_roi_profile(profile_path, list(zip(names, rois)))
+
+    def _prepare_resume(self, data_csv_paths, checkpoint_states):
+        """
+        Returns the frame number to resume after (0 to start from scratch). All outputs of a video are written in
+        lockstep, so they resume together or not at all. On resume, each partial output is cut back to its length at
+        the checkpoint, dropping any rows written after it.
+        """
+        if self.checkpoint_seconds <= 0:
+            return 0
+        checkpoints = [read_checkpoint(data_csv_full_path) for data_csv_full_path in data_csv_paths]
+        if not any(checkpoints):
+            return 0
+        problem = None
+        if not all(checkpoints) or len({checkpoint['frame_number'] for checkpoint in checkpoints}) != 1:
+            problem = "the outputs of this video were checkpointed at different frames"
+        elif any(checkpoint.get(key) != value
+                 for checkpoint, checkpoint_state in zip(checkpoints, checkpoint_states)
+                 for key, value in checkpoint_state.items()):
+            problem = "the video or the processing settings changed since"
+        elif any(not os.path.exists(data_csv_full_path) or os.path.getsize(data_csv_full_path) < checkpoint['csv_bytes']
+                 for data_csv_full_path, checkpoint in zip(data_csv_paths, checkpoints)):
+            problem = "the partial output is missing or shorter than recorded"
+        if problem:
+            print(f"Checkpoint found, but {problem}. Starting from the first frame.")
+            for data_csv_full_path in data_csv_paths:
+                remove_checkpoint(data_csv_full_path)
+            return 0
+        if checkpoints[0]['frame_number'] == 0:
+            print("Outputs of an interrupted run found, cut off before their first checkpoint. Starting from the first frame.")
+            return 0
+        for data_csv_full_path, checkpoint in zip(data_csv_paths, checkpoints):
+            with open(data_csv_full_path, 'r+b') as partial_file:
+                partial_file.truncate(checkpoint['csv_bytes'])
+        print(f"Resuming from checkpoint after frame {checkpoints[0]['frame_number']}.")
+        return checkpoints[0]['frame_number']
+
+    def _seek_for_resume(self, cap, resume_frame, rois):
+        # Same overlap trick as segments: reread the last checkpointed frame as prev_gray for the next diff
+        cap.set(cv2.CAP_PROP_POS_FRAMES, resume_frame - 1)
+        ret, overlap_frame = cap.read()
+        if not ret:
+            print(f"Warning: Could not reread frame {resume_frame} to resume; the next frame gets no metrics row.")
+            return None
+        return self._to_grays(overlap_frame, rois, getattr(cap, 'downscale', 1))
+
+    def _checkpoint_writer(self, output_files, data_csv_paths, checkpoint_states):
+        # Called by _process_frames after each batch write; checkpoints at most every checkpoint_seconds
+        last_checkpoint_time = [time.time()]
+        def on_flush(frame_number):
+            if time.time() - last_checkpoint_time[0] < self.checkpoint_seconds:
+                return
+            for output_file, data_csv_full_path, checkpoint_state in zip(output_files, data_csv_paths, checkpoint_states):
+                output_file.flush()
+                os.fsync(output_file.fileno()) # The rows must be on disk before a checkpoint claims them
+                write_checkpoint(data_csv_full_path, dict(checkpoint_state, frame_number=frame_number,
+                                                          csv_bytes=os.fstat(output_file.fileno()).st_size))
+            last_checkpoint_time[0] = time.time()
+        return on_flush
+
+    def _open_decoder(self, video_file_path, rois):
+        # Scaling inside the decoder happens before any crop, so it is only used without an ROI
+        return open_video(video_file_path, self.decoder, self.decoder_threads,
+                          downscale=1 if any(rois) else int(self.downscale))
+
+    def _to_gray(self, frame, current_file_roi, decoder_downscale=1, workspace=None):
+        # Crop (a view, no copy), convert once, then downscale: the only per-frame preparation before the kernel.
+        # Gray decoders skip the conversion, and may already have done the downscale (decoder_downscale).
+        # With a KernelWorkspace the result lands in its alternating gray buffers (valid as prev_gray for one more frame).
+        if current_file_roi: # Apply ROI if one is set and valid for this file
+            frame = self._apply_roi(frame, current_file_roi)
+        downscale = int(self.downscale) // decoder_downscale
+        if frame.ndim == 2:
+            gray = frame
+        elif downscale > 1: # Converted frame only feeds the resize below
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                dst=workspace.buffer('full_gray', frame.shape[:2]) if workspace else None)
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=workspace.next_gray(frame.shape[:2]) if workspace else None)
+        if downscale > 1:
+            return downscale_gray(gray, downscale,
+                                  dst=workspace.next_gray(downscaled_shape(gray.shape, downscale)) if workspace else None)
+        return gray
+
+    def _to_grays(self, frame, rois, decoder_downscale=1, workspaces=None, frame_workspace=None):
+        # One gray frame per ROI. With several ROIs the whole frame is converted once (into frame_workspace) and each
+        # ROI is a view of it, downscaled into that ROI's workspace.
+        workspaces = workspaces or [None] * len(rois)
+        if len(rois) == 1:
+            return [self._to_gray(frame, rois[0], decoder_downscale, workspaces[0])]
+        gray = self._to_gray(frame, None, int(self.downscale), frame_workspace) # Same factor: no downscale here
+        return [self._to_gray(gray, roi, decoder_downscale, workspace) for roi, workspace in zip(rois, workspaces)]
+
+    def _metrics_function(self, frame_counters):
+        # f(gray, prev_gray, parameter_sets) -> (raw_diff, rmse, [selected_pixel_diff per set])
+        if self.metrics_kernel == 'fused':
+            return partial(self._calculate_metrics_multi, counters=frame_counters, strip_rows=int(self.strip_rows))
+        return self._calculate_metrics_sets
+
+    @staticmethod
+    def _calculate_metrics_sets(gray, prev_gray, parameter_sets, workspace=None):
+        # The float reference kernel shares nothing between sets (nor uses the workspace); it simply runs once per set
+        selected_pixel_diffs = []
+        for global_threshold, min_size_threshold, percentage_threshold, dilation_kernel in parameter_sets:
+            raw_diff, rmse, selected_pixel_diff = calculate_metrics(gray, prev_gray, global_threshold, min_size_threshold,
+                                                                    percentage_threshold, dilation_kernel)
+            selected_pixel_diffs.append(selected_pixel_diff)
+        return raw_diff, rmse, selected_pixel_diffs
+
+    def _process_segments(self, video_file_path, rois, creation_time, total_frames,
+                          num_segments, data_csv_paths, output_files, progress_callback=None, abort_check=None):
+        """
+        Processes one video as num_segments frame ranges in a process pool and appends their rows,
+        in frame order, to the already opened output_files (one per ROI). Returns the summed frame counters.
+        """
+        # Starts are multiples of frame_step, so every segment samples the same frames a single pass would
+        frame_step = int(self.frame_step)
+        bounds = sorted({total_frames * i // num_segments // frame_step * frame_step for i in range(num_segments)})
+        num_segments = len(bounds)
+        segment_jobs = []
+        for index, start_frame in enumerate(bounds):
+            end_frame = bounds[index + 1] if index + 1 < num_segments else None # Last segment runs to the end of the stream
+            part_csv_paths = [f"{data_csv_full_path}.part{index}" for data_csv_full_path in data_csv_paths]
+            segment_jobs.append((self, video_file_path, rois, creation_time, start_frame, end_frame, part_csv_paths))
+
+        frame_counters = {'frame_pairs': 0, 'quiet_frames': 0}
+        try:
+            with Pool(processes=min(num_segments, cpu_count())) as pool:
+                # Counted as each segment finishes, in any order; only the stitch below needs frame order
+                segments_done = 0
+                for segment_counters in pool.imap_unordered(_process_video_segment_job, segment_jobs):
+                    frame_counters['frame_pairs'] += segment_counters['frame_pairs']
+                    frame_counters['quiet_frames'] += segment_counters['quiet_frames']
+                    segments_done += 1
+                    print(f"Segment {segments_done} of {num_segments} finished.")
+                    if progress_callback:
+                        progress_callback.emit(int((segments_done / num_segments) * 100))
+
+            if abort_check: abort_check()
+            for job in segment_jobs: # Stitch in frame order
+                for part_csv_path, output_file in zip(job[-1], output_files):
+                    with open(part_csv_path, 'r', newline='') as part_file:
+                        shutil.copyfileobj(part_file, output_file)
+        finally:
+            for job in segment_jobs:
+                for part_csv_path in job[-1]:
+                    if os.path.exists(part_csv_path):
+                        os.remove(part_csv_path)
+        return frame_counters
+
+    def _process_frames(self, reader, rois, calculate_metrics, creation_time,
+                        total_frames, writers, frame_counters, progress_callback=None,
+                        prev_grays=None, frame_number=0, last_frame_number=None, on_flush=None, abort_check=None):
+        """
+        Frame loop shared by every video: read once, then per ROI crop, convert and diff against that ROI's previous
+        gray frame, evaluating every parameter set on the one difference. writers holds one writer per (ROI, set),
+        in _video_outputs order.
+        prev_grays/frame_number let a segment or a resumed video continue from an overlap frame (frame_number is its
+        1-based number, 0 for a fresh stream); last_frame_number stops a segment at its range end. Frame numbers
+        advance by frame_step once the first frame of a fresh stream is read, matching the reader.
+        on_flush(frame_number) is called after each batch write (checkpoints), abort_check() before each.
+        """
+        frame_step = int(self.frame_step)
+        downscale = int(self.downscale)
+        parameter_sets = []
+        for _, thresholds in self._parameter_sets():
+            min_size_threshold, dilation_kernel = downscaled_parameters(float(thresholds['min_size_threshold']),
+                                                                        int(thresholds['dilation_kernel']), downscale)
+            parameter_sets.append((float(thresholds['global_threshold']), min_size_threshold,
+                                   float(thresholds['percentage_threshold']), dilation_kernel))
+        sets_per_roi = len(parameter_sets)
+        # Pixel sums scaled back to full-resolution-equivalent units, if asked for (RMSE is a mean, so unaffected)
+        pixel_scale = downscale * downscale if self.full_resolution_units else 1
+        decoder_downscale = getattr(reader.cap, 'downscale', 1) # Part of the downscale already done while decoding
+        prev_grays = list(prev_grays) if prev_grays else [None] * len(rois)
+        # Buffers for the whole loop: one workspace per ROI, plus one for the shared full-frame gray of several ROIs
+        workspaces = [KernelWorkspace() for _ in rois]
+        frame_workspace = KernelWorkspace()
+        result_rows = [[] for _ in writers]
+        frames_since_write = 0
+        next_progress_frame = frame_number + 100
+        while True:
+            next_frame_number = frame_number + frame_step if frame_number > 0 else 1
+            if last_frame_number is not None and next_frame_number > last_frame_number:
+                break
+            ret, decoded_frame, elapsed_millis = reader.read()
+            if not ret:
+                break
+            frame_number = next_frame_number
+
+            grays = self._to_grays(decoded_frame, rois, decoder_downscale, workspaces, frame_workspace)
+            reader.recycle(decoded_frame) # the grays are in workspace buffers, so the decode buffer can be reused
+
+            for roi_index, gray in enumerate(grays):
+                prev_gray = prev_grays[roi_index]
+                prev_grays[roi_index] = gray # Alternating workspace buffer (or a decoder frame that is never reused)
+                if prev_gray is None:
+                    continue
+                # Ensure dimensions match if ROI is applied inconsistently (should not happen with this logic)
+                if gray.shape != prev_gray.shape:
+                    print(f"Warning: Frame shape mismatch between current ({gray.shape}) and previous ({prev_gray.shape}). This may occur if ROI changes mid-processing or at the start. Skipping metrics for this frame.")
+                    continue
+
+                raw_diff, rmse, selected_pixel_diffs = calculate_metrics(gray, prev_gray, parameter_sets,
+                                                                         workspace=workspaces[roi_index])
+                if pixel_scale != 1:
+                    raw_diff *= pixel_scale
+                frame_counters['frame_pairs'] += 1
+                posix_time = int(creation_time + elapsed_millis)
+                for set_index, selected_pixel_diff in enumerate(selected_pixel_diffs):
+                    result_rows[roi_index * sets_per_roi + set_index].append(
+                        [frame_number, elapsed_millis, raw_diff, rmse, selected_pixel_diff * pixel_scale, posix_time])
+
+            frames_since_write += 1
+            if frames_since_write >= 1000: # Batch write, all ROIs at the same frame so one checkpoint covers them
+                if abort_check: abort_check()
+                for writer, rows in zip(writers, result_rows):
+                    writer.writerows(rows)
+                result_rows = [[] for _ in writers]
+                frames_since_write = 0
+                if on_flush:
+                    on_flush(frame_number)
+
+            if progress_callback and frame_number >= next_progress_frame:
+                next_progress_frame += 100
+                progress = (frame_number / total_frames) * 100 if total_frames > 0 else 0
+                progress_callback.emit(int(progress))
+
+        if abort_check: abort_check()
+        for writer, rows in zip(writers, result_rows): # Write any remaining rows
+            writer.writerows(rows)
+
+    _calculate_metrics = staticmethod(calculate_metrics)
+    _calculate_metrics_multi = staticmethod(calculate_metrics_multi)
+
+    @staticmethod
+    def _get_creation_time_from_name(filename):
+        return creation_time_from_name(filename, 'rbb01')
@@ -0,0 +1,91 @@
+# Background frame decoding for the processor's frame loop.
+
+import threading
+from queue import Queue, Empty
+import cv2
+import numpy as np
+
+class FramePrefetcher:
+    """
+    Reads frames from an opened cv2.VideoCapture on a background thread into a ring of preallocated
+    buffers, so decoding (which releases the GIL) overlaps with the metric kernel on the calling thread.
+    With queue_depth 0 every read() decodes synchronously on the caller's thread.
+    With frame_step > 1 only every frame_step-th frame is returned; the ones in between are only grabbed
+    (no retrieve, so no BGR conversion or copy). skip_before_first also skips before the first returned frame,
+    for a stream positioned just after an already processed frame (segment overlap, resume).
+    """
+    def __init__(self, cap, queue_depth=4, frame_step=1, skip_before_first=False):
+        self.cap = cap
+        self.queue_depth = max(0, int(queue_depth))
+        self.frame_step = max(1, int(frame_step))
+        self._skip_pending = skip_before_first
+        self._filled = Queue(maxsize=max(1, self.queue_depth))
+        self._free = Queue()
+        self._stopping = False
+        self._error = None
+        self._thread = None
+        if self.queue_depth > 0:
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            # Decoders that return new arrays (actigraphy.decoders) just get None tokens that bound the queue
+            preallocate = getattr(cap, 'reuses_buffers', True) and width > 0 and height > 0
+            # queued frames + the one being decoded + the one the caller is still converting
+            for _ in range(self.queue_depth + 2):
+                self._free.put(np.empty((height, width, 3), np.uint8) if preallocate else None)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _read_next(self, buffer=None):
+        if self._skip_pending:
+            for _ in range(self.frame_step - 1):
+                if not self.cap.grab():
+                    return False, None
+        self._skip_pending = True
+        # cap.read decodes straight into buffer when its shape matches, otherwise it allocates a new one
+        return self.cap.read(buffer) if buffer is not None else self.cap.read()
+
+    def _run(self):
+        try:
+            while True:
+                buffer = self._free.get()
+                if self._stopping:
+                    break
+                ret, frame = self._read_next(buffer)
+                if not ret:
+                    break
+                self._filled.put((frame, self.cap.get(cv2.CAP_PROP_POS_MSEC)))
+        except Exception as e:
+            self._error = e
+        self._filled.put(None) # End of stream
+
+    def read(self):
+        """Returns (ret, frame, elapsed_millis) like cap.read() plus the CAP_PROP_POS_MSEC of that frame."""
+        if self._thread is None:
+            ret, frame = self._read_next()
+            return ret, frame, self.cap.get(cv2.CAP_PROP_POS_MSEC) if ret else None
+        item = self._filled.get()
+        if item is None:
+            self._filled.put(None) # Keep reporting end of stream on further reads
+            if self._error is not None:
+                raise self._error
+            return False, None, None
+        frame, elapsed_millis = item
+        return True, frame, elapsed_millis
+
+    def recycle(self, frame):
+        """Hands a frame buffer returned by read() back to the reader once the caller no longer needs it."""
+        if self._thread is not None:
+            self._free.put(frame)
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._stopping = True
+        while self._thread.is_alive():
+            try:
+                self._filled.get_nowait() # Unblock a reader waiting on a full queue
+            except Empty:
+                pass
+            self._free.put(None) # Unblock a reader waiting for a free buffer
+            self._thread.join(timeout=0.05)
+        self._thread = None
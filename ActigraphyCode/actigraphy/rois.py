@@ -0,0 +1,73 @@
+# Named ROIs for cameras that film several cages at once. One decoded stream is cropped into every ROI and each one
+# gets its own output, <video name>_<ROI name>_actigraphy.csv, so one decode serves all the animals in view.
+# The config is a CSV with a Name,X,Y,W,H header and one row per cage; lines starting with # are comments:
+#   Name,X,Y,W,H
+#   cage1,0,0,320,240
+#   cage2,320,0,320,240
+#
+# ROI profiles are the same file saved as actigraphy_roi_profile.csv in a video folder, so ROI runs need no display:
+# each video uses the profile of its own folder, or else of the nearest parent folder that has one (one profile per
+# animal folder, or one for a whole cohort). A profile with a single ROI crops the usual <video>_actigraphy.csv; one
+# with several works like a --roi_config file.
+
+import csv
+import os
+import re
+
+ROI_PROFILE_FILENAME = 'actigraphy_roi_profile.csv'
+
+_ROI_NAME = re.compile(r'^[A-Za-z0-9_-]+$') # Goes into output file names
+
+def load_roi_config(roi_config_path):
+    """
+    Reads a named ROI config. Returns [(name, (x, y, w, h))] in file order.
+    Raises ValueError on a malformed row, a duplicate or unusable name, or a zero-sized ROI.
+    """
+    named_rois = []
+    with open(roi_config_path, 'r', newline='') as roi_file:
+        rows = [row for row in csv.reader(roi_file) if row and not row[0].strip().startswith('#')]
+    if rows and [cell.strip().lower() for cell in rows[0]] == ['name', 'x', 'y', 'w', 'h']:
+        rows = rows[1:]
+    for row in rows:
+        if len(row) != 5:
+            raise ValueError(f"{roi_config_path}: expected Name,X,Y,W,H but got {','.join(row)}")
+        name = row[0].strip()
+        if not _ROI_NAME.match(name):
+            raise ValueError(f"{roi_config_path}: ROI name {name!r} may only use letters, digits, _ and -")
+        try:
+            x, y, w, h = (int(cell) for cell in row[1:])
+        except ValueError:
+            raise ValueError(f"{roi_config_path}: ROI {name} has non-integer coordinates {','.join(row[1:])}") from None
+        if x < 0 or y < 0 or w <= 0 or h <= 0:
+            raise ValueError(f"{roi_config_path}: ROI {name} needs x, y >= 0 and w, h > 0")
+        if any(name == existing_name for existing_name, _ in named_rois):
+            raise ValueError(f"{roi_config_path}: ROI name {name} is used twice")
+        named_rois.append((name, (x, y, w, h)))
+    if not named_rois:
+        raise ValueError(f"{roi_config_path}: no ROIs defined")
+    return named_rois
+
+def roi_profile_path(folder):
+    return os.path.join(folder, ROI_PROFILE_FILENAME)
+
+def find_roi_profile(folder):
+    # Nearest profile from folder upwards, None if no folder on the way has one
+    folder = os.path.abspath(folder)
+    while True:
+        profile_path = roi_profile_path(folder)
+        if os.path.exists(profile_path):
+            return profile_path
+        parent_folder = os.path.dirname(folder)
+        if parent_folder == folder:
+            return None
+        folder = parent_folder
+
+def save_roi_profile(profile_path, named_rois):
+    # Atomic replace, like the other sidecar files, so a job never reads a half written profile
+    temp_path = profile_path + ".tmp"
+    with open(temp_path, 'w', newline='') as profile_file:
+        writer = csv.writer(profile_file)
+        writer.writerow(['Name', 'X', 'Y', 'W', 'H'])
+        writer.writerows([name, *roi] for name, roi in named_rois)
+    os.replace(temp_path, profile_path)
+    print(f"ROI profile saved to: {profile_path}")
@@ -0,0 +1,75 @@
+# Splitting a folder's videos across SLURM array tasks, per-shard completion markers, and the merge check.
+# Every array task runs the same discovery and assign_shards, so they agree on the split without talking to each other.
+
+import csv
+import os
+
+def shard_label(shard_index, shard_count):
+    return f"shard{shard_index + 1}of{shard_count}"
+
+def shard_from_environment():
+    """
+    (shard_index, shard_count) from SLURM_ARRAY_TASK_ID/SLURM_ARRAY_TASK_COUNT, or (0, 1) outside an array job.
+    The index is made 0-based relative to SLURM_ARRAY_TASK_MIN, so --array=1-10 and --array=0-9 both work.
+    Only contiguous --array=a-b ranges map onto shards; for a list or a stepped range (--array=1,4,7 or 1-10:3) the
+    index is None and --shard_index/--shard_count have to be given.
+    """
+    task_id = os.environ.get('SLURM_ARRAY_TASK_ID')
+    task_count = os.environ.get('SLURM_ARRAY_TASK_COUNT')
+    if task_id is None or task_count is None:
+        return 0, 1
+    task_min = int(os.environ.get('SLURM_ARRAY_TASK_MIN', 0))
+    task_max = os.environ.get('SLURM_ARRAY_TASK_MAX')
+    if task_max is not None and int(task_max) - task_min + 1 != int(task_count):
+        return None, int(task_count)
+    return int(task_id) - task_min, int(task_count)
+
+def assign_shards(video_file_paths, shard_count, size_of=os.path.getsize):
+    """
+    Greedy largest-first split: each video (by file size) goes to the shard with the least total size so far.
+    Ties are broken by path so every array task computes the same assignment. Returns one list per shard.
+    """
+    sized = sorted(((size_of(path), path) for path in video_file_paths), key=lambda item: (-item[0], item[1]))
+    shards = [[] for _ in range(shard_count)]
+    shard_sizes = [0] * shard_count
+    for size, path in sized:
+        target = min(range(shard_count), key=lambda index: (shard_sizes[index], index))
+        shards[target].append(path)
+        shard_sizes[target] += size
+    return [sorted(shard) for shard in shards]
+
+def shard_marker_path(marker_dir, folder_basename, shard_index, shard_count):
+    return os.path.join(marker_dir, f"{folder_basename}_{shard_label(shard_index, shard_count)}_complete.csv")
+
+def write_shard_marker(marker_dir, folder_basename, shard_index, shard_count, video_outputs):
+    # Written last, so its presence means every video assigned to the shard has its output CSV.
+    # video_outputs is [(video, output CSV)]; a video with several named ROIs is listed once per output.
+    marker_path = shard_marker_path(marker_dir, folder_basename, shard_index, shard_count)
+    temp_path = marker_path + ".tmp"
+    with open(temp_path, 'w', newline='') as marker_file:
+        writer = csv.writer(marker_file)
+        writer.writerow(["Video", "Actigraphy CSV"])
+        writer.writerows(sorted(video_outputs))
+    os.replace(temp_path, marker_path)
+    print(f"Shard completion marker saved to: {marker_path}")
+    return marker_path
+
+def check_shards(marker_dir, folder_basename, shard_count):
+    """
+    Merge step: confirms every shard wrote its marker and every output it lists exists.
+    Returns (missing_shard_numbers, missing_outputs); both empty means the whole folder finished.
+    """
+    missing_shards = []
+    missing_outputs = []
+    for shard_index in range(shard_count):
+        marker_path = shard_marker_path(marker_dir, folder_basename, shard_index, shard_count)
+        if not os.path.exists(marker_path):
+            missing_shards.append(shard_index + 1)
+            continue
+        with open(marker_path, 'r', newline='') as marker_file:
+            reader = csv.reader(marker_file)
+            next(reader, None) # Header
+            for row in reader:
+                if len(row) >= 2 and not os.path.exists(row[1]):
+                    missing_outputs.append(row[1])
+    return missing_shards, missing_outputs
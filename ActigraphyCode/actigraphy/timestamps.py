@@ -0,0 +1,41 @@
+# Recording start times (POSIX milliseconds) parsed from video file names, with the file's ctime as fallback.
+
+import os
+import re
+from datetime import datetime
+
+# name: (regex with the date/time in group 1 and optional milliseconds in group 2, strptime format for group 1)
+NAME_STAMP_FORMATS = {
+    'rbb01': (r'RBB01_T(\d{8}-\d{6})(\d{3})', '%Y%m%d-%H%M%S'),                  # actigraphy_v7: RBB01_T20240101-120000123
+    'date_time': (r'(\d{8}_\d{6})', '%Y%m%d_%H%M%S'),                             # actigraphy5RAW: 20240101_120000
+    'date_time_ms': (r'(\d{8}_\d{2}-\d{2}-\d{2})\.(\d{3})', '%Y%m%d_%H-%M-%S'),   # actigraphy5RAW_alt: 20240101_12-00-00.123
+}
+
+def parse_name_timestamp(filename, name_stamp_format='rbb01'):
+    # Quiet variant for indexing: POSIX milliseconds from the name, or None if there is no (valid) stamp
+    regex_pattern, date_time_format = NAME_STAMP_FORMATS[name_stamp_format]
+    match = re.search(regex_pattern, os.path.basename(filename))
+    if not match:
+        return None
+    millisecond = match.group(2) if match.lastindex and match.lastindex >= 2 else '0'
+    try:
+        return int(datetime.strptime(match.group(1), date_time_format).timestamp() * 1000) + int(millisecond)
+    except ValueError:
+        return None
+
+def creation_time_from_name(filename, name_stamp_format='rbb01'):
+    regex_pattern, date_time_format = NAME_STAMP_FORMATS[name_stamp_format]
+    match = re.search(regex_pattern, os.path.basename(filename))
+    if match:
+        date_time_str = match.group(1)
+        millisecond = match.group(2) if match.lastindex and match.lastindex >= 2 else '0'
+        try:
+            date_time_obj = datetime.strptime(date_time_str, date_time_format)
+            posix_timestamp_ms = int(date_time_obj.timestamp() * 1000) + int(millisecond)
+            return posix_timestamp_ms
+        except ValueError: # Handle cases like invalid date (e.g. Feb 30)
+            print(f"Warning: Could not parse valid date from filename pattern: {date_time_str}. Using file generated time.")
+            return int(os.path.getctime(filename) * 1000)
+    else:
+        print(f"Failed to extract creation time from the file name using pattern. Using file generated time for {os.path.basename(filename)}.")
+        return int(os.path.getctime(filename) * 1000)
@@ -0,0 +1,290 @@
+# Threshold tuning without replaying videos. Run from ActigraphyCode:
+# python3 -m actigraphy.tuning sample --video_folder /path --output corpus.npz --pairs_per_video 50 --roi X Y W H
+# python3 -m actigraphy.tuning sweep --corpus corpus.npz --output sweep.csv --workers 8
+# sample draws frame pairs spread over each video's length (plus every hand-labelled pair) and stores them as gray
+# crops in one compressed file. sweep evaluates a grid of the four thresholds against that file in a process pool and
+# writes one row per parameter set: SelectedPixelDifference distribution and, with labels, agreement with them.
+#
+# Labels are a CSV with a Video,Frame,Label header: Video is the path relative to --video_folder (a bare file name is
+# enough while no other video in the corpus has that name), Frame the Frame column of the output row (the later frame
+# of the pair, 1-based) and Label moving/still (or 1/0). A pair counts as moving for a parameter set
+# when its SelectedPixelDifference is above 0.
+
+import argparse
+import csv
+import itertools
+import os
+import posixpath
+import sys
+from collections import Counter
+from multiprocessing import Pool
+import cv2
+import numpy as np
+from actigraphy.discovery import scan_tree
+from actigraphy.kernels import calculate_metrics_multi, downscale_gray, downscaled_parameters
+from actigraphy.presets import MOVEMENT_PRESETS
+
+_LABEL_VALUES = {'moving': 1, '1': 1, 'still': 0, '0': 0}
+
+SWEEP_FIELDS = ['GlobalThreshold', 'PercentageThreshold', 'MinSizeThreshold', 'DilationKernel', 'Pairs',
+                'MovingFraction', 'MeanSelected', 'MedianSelected', 'P90Selected', 'P99Selected', 'MaxSelected',
+                'LabelledPairs', 'Accuracy', 'TruePositiveRate', 'FalsePositiveRate']
+
+def _video_key(path):
+    # Label video names compare as forward-slash relative paths, whichever OS wrote the labels file
+    return posixpath.normpath(path.strip().replace('\\', '/'))
+
+def read_labels(labels_csv_path):
+    # {(video path relative to the corpus root, frame number): 1 moving / 0 still}
+    labels = {}
+    with open(labels_csv_path, 'r', newline='') as labels_file:
+        for row in csv.DictReader(labels_file):
+            label = _LABEL_VALUES.get(row['Label'].strip().lower())
+            if label is None:
+                raise ValueError(f"{labels_csv_path}: label {row['Label']!r} for {row['Video']} frame {row['Frame']} "
+                                 "is not moving/still/1/0")
+            labels[(_video_key(row['Video']), int(row['Frame']))] = label
+    return labels
+
+def check_label_videos(labels, video_file_paths):
+    # A bare file name is only unambiguous while no two videos in the corpus share it
+    name_counts = Counter(os.path.basename(path) for path in video_file_paths)
+    for name in sorted({name for name, _ in labels}):
+        if '/' not in name and name_counts[name] > 1:
+            raise ValueError(f"{name} matches {name_counts[name]} videos in different folders; "
+                             "give its path relative to --video_folder instead")
+
+def _sample_frames(frame_count, pairs_per_video, frame_step, rng):
+    # One frame per equal slice of the video, so a corpus covers every part of a recording (day and night)
+    first_frame, last_frame = frame_step + 1, frame_count # 1-based numbers of the later frame of a pair
+    if last_frame < first_frame:
+        return []
+    bin_edges = np.linspace(first_frame, last_frame + 1, min(pairs_per_video, last_frame - first_frame + 1) + 1)
+    return sorted({int(rng.integers(int(low), max(int(low) + 1, int(high)))) for low, high in zip(bin_edges, bin_edges[1:])})
+
+def _read_pair(cap, frame_number, frame_step, roi, downscale):
+    # Gray (previous, current) for the pair ending at 1-based frame_number, cropped and downscaled like the processor
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number - frame_step - 1)
+    grays = []
+    for index in range(2):
+        if index == 1:
+            for _ in range(frame_step - 1):
+                cap.grab()
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        if roi:
+            x, y, w, h = roi
+            frame = frame[y:y+h, x:x+w]
+        grays.append(downscale_gray(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), downscale))
+    return grays
+
+def sample_corpus(video_file_paths, corpus_path, pairs_per_video=50, frame_step=1, roi=None, downscale=1,
+                  labels=None, seed=0, root=None):
+    """
+    Writes frame pairs from the videos to corpus_path (compressed .npz). Returns the number of pairs stored.
+    Labelled pairs of these videos are always included, on top of the evenly spread samples; label videos are
+    matched by path relative to root (see check_label_videos for bare file names).
+    """
+    rng = np.random.default_rng(seed)
+    labels = labels or {}
+    arrays = {}
+    pair_videos, pair_frames, pair_labels = [], [], []
+    for video_index, video_file_path in enumerate(video_file_paths):
+        cap = cv2.VideoCapture(video_file_path)
+        if not cap.isOpened():
+            print(f"Could not open {video_file_path}; skipping it.")
+            continue
+        video_name = os.path.basename(video_file_path)
+        relative_key = _video_key(os.path.relpath(video_file_path, root)) if root else video_name
+        label_key = relative_key if any(name == relative_key for name, _ in labels) else video_name
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        labelled_frames = []
+        for (name, frame) in labels:
+            if name != label_key:
+                continue
+            # Only frames that have a row in the output CSVs: the first one has no pair, and rows are frame_step apart
+            if not frame_step + 1 <= frame <= frame_count or (frame - 1) % frame_step:
+                print(f"Label for frame {frame} of {video_name} skipped: output rows are frames "
+                      f"{frame_step + 1}, {2 * frame_step + 1}, ... up to {frame_count}.")
+                continue
+            labelled_frames.append(frame)
+        frame_numbers = sorted(set(_sample_frames(frame_count, pairs_per_video, frame_step, rng)) | set(labelled_frames))
+        for frame_number in frame_numbers:
+            pair = _read_pair(cap, frame_number, frame_step, roi, downscale)
+            if pair is None:
+                print(f"Could not read frame pair ending at {frame_number} of {video_name}; skipping it.")
+                continue
+            pair_index = len(pair_frames)
+            arrays[f"prev_{pair_index}"], arrays[f"cur_{pair_index}"] = pair
+            pair_videos.append(video_index)
+            pair_frames.append(frame_number)
+            pair_labels.append(labels.get((label_key, frame_number), -1)) # -1: not labelled
+        cap.release()
+        print(f"{video_name}: {len(frame_numbers)} frame pairs sampled.")
+
+    np.savez_compressed(corpus_path, videos=np.array([os.path.abspath(path) for path in video_file_paths]),
+                        pair_videos=np.array(pair_videos, dtype=np.int32), pair_frames=np.array(pair_frames, dtype=np.int64),
+                        pair_labels=np.array(pair_labels, dtype=np.int8), frame_step=frame_step, downscale=downscale,
+                        roi=np.array(roi if roi else [], dtype=np.int32), **arrays)
+    print(f"Frame pair corpus saved to: {corpus_path} ({len(pair_frames)} pairs, "
+          f"{int(np.sum(np.array(pair_labels) >= 0))} labelled)")
+    return len(pair_frames)
+
+def load_corpus(corpus_path):
+    # {'pairs': [(prev_gray, gray)], 'labels': array of 1/0/-1, 'downscale': int, plus the stored pair details}
+    with np.load(corpus_path) as corpus_file:
+        pair_count = len(corpus_file['pair_frames'])
+        return {
+            'pairs': [(corpus_file[f"prev_{index}"], corpus_file[f"cur_{index}"]) for index in range(pair_count)],
+            'labels': corpus_file['pair_labels'],
+            'videos': corpus_file['videos'],
+            'pair_videos': corpus_file['pair_videos'],
+            'pair_frames': corpus_file['pair_frames'],
+            'downscale': int(corpus_file['downscale']),
+        }
+
+_worker_corpus = None # Per-process corpus loaded once by _init_sweep_worker
+
+def _init_sweep_worker(corpus_path):
+    global _worker_corpus
+    _worker_corpus = load_corpus(corpus_path)
+
+def _sweep_chunk(parameter_sets):
+    # SelectedPixelDifference of every corpus pair for up to 8 parameter sets (one shared lookup per pair); one row per set
+    downscale = _worker_corpus['downscale']
+    kernel_sets = []
+    for global_threshold, percentage_threshold, min_size_threshold, dilation_kernel in parameter_sets:
+        scaled_min_size, scaled_dilation = downscaled_parameters(min_size_threshold, dilation_kernel, downscale)
+        kernel_sets.append((global_threshold, scaled_min_size, percentage_threshold, scaled_dilation))
+    selected = np.zeros((len(parameter_sets), len(_worker_corpus['pairs'])), dtype=np.int64)
+    for pair_index, (prev_gray, gray) in enumerate(_worker_corpus['pairs']):
+        _, _, selected_pixel_diffs = calculate_metrics_multi(gray, prev_gray, kernel_sets)
+        selected[:, pair_index] = selected_pixel_diffs
+    return selected
+
+def summarize(parameter_set, selected, labels):
+    # One SWEEP_FIELDS row for a parameter set from its SelectedPixelDifference per pair
+    global_threshold, percentage_threshold, min_size_threshold, dilation_kernel = parameter_set
+    moving = selected > 0
+    row = {
+        'GlobalThreshold': global_threshold, 'PercentageThreshold': percentage_threshold,
+        'MinSizeThreshold': min_size_threshold, 'DilationKernel': dilation_kernel,
+        'Pairs': len(selected), 'MovingFraction': round(float(moving.mean()), 4) if len(selected) else '',
+        'MeanSelected': round(float(selected.mean()), 2) if len(selected) else '',
+        'MedianSelected': float(np.median(selected)) if len(selected) else '',
+        'P90Selected': float(np.percentile(selected, 90)) if len(selected) else '',
+        'P99Selected': float(np.percentile(selected, 99)) if len(selected) else '',
+        'MaxSelected': int(selected.max()) if len(selected) else '',
+        'LabelledPairs': int(np.sum(labels >= 0)), 'Accuracy': '', 'TruePositiveRate': '', 'FalsePositiveRate': '',
+    }
+    labelled_moving, labelled_still = labels == 1, labels == 0
+    if row['LabelledPairs']:
+        row['Accuracy'] = round(float(np.mean(moving[labels >= 0] == labelled_moving[labels >= 0])), 4)
+    if labelled_moving.any():
+        row['TruePositiveRate'] = round(float(moving[labelled_moving].mean()), 4)
+    if labelled_still.any():
+        row['FalsePositiveRate'] = round(float(moving[labelled_still].mean()), 4)
+    return row
+
+def sweep_corpus(corpus_path, parameter_grid, sweep_csv_path, workers=1):
+    """
+    Evaluates every parameter set (global, percentage, min size, dilation) in parameter_grid on the corpus and writes
+    SWEEP_FIELDS rows to sweep_csv_path. Sets are evaluated 8 at a time per task, in a pool when workers > 1.
+    Returns the rows.
+    """
+    corpus = load_corpus(corpus_path)
+    parameter_grid = list(parameter_grid)
+    chunks = [parameter_grid[start:start + 8] for start in range(0, len(parameter_grid), 8)]
+    print(f"Sweeping {len(parameter_grid)} parameter sets over {len(corpus['pairs'])} frame pairs in {len(chunks)} tasks.")
+    if workers > 1:
+        with Pool(processes=workers, initializer=_init_sweep_worker, initargs=(corpus_path,)) as pool:
+            chunk_results = pool.map(_sweep_chunk, chunks)
+    else:
+        global _worker_corpus
+        _worker_corpus = corpus
+        chunk_results = [_sweep_chunk(chunk) for chunk in chunks]
+
+    rows = []
+    for chunk, selected in zip(chunks, chunk_results):
+        rows.extend(summarize(parameter_set, set_selected, corpus['labels'])
+                    for parameter_set, set_selected in zip(chunk, selected))
+    with open(sweep_csv_path, 'w', newline='') as sweep_file:
+        writer = csv.DictWriter(sweep_file, fieldnames=SWEEP_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Sweep results saved to: {sweep_csv_path}")
+    return rows
+
+def _video_paths(video_file, video_folder):
+    if video_file:
+        return [video_file]
+    return [os.path.join(folder, name) for folder, names in scan_tree(video_folder).items()
+            for name in names if name.lower().endswith('.mp4')]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sample frame pairs and sweep threshold grids for actigraphy tuning.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sample_parser = subparsers.add_parser('sample', help='Sample frame pairs from videos into a corpus file.')
+    sample_parser.add_argument('--video_file', type=str, help='A single video.')
+    sample_parser.add_argument('--video_folder', type=str, help='Folder searched recursively for mp4 files.')
+    sample_parser.add_argument('--output', type=str, required=True, help='Corpus file to write (.npz).')
+    sample_parser.add_argument('--pairs_per_video', type=int, default=50, help='Frame pairs spread over each video. Default: 50.')
+    sample_parser.add_argument('--labels', type=str, help='Video,Frame,Label CSV of hand-labelled moving/still pairs.')
+    sample_parser.add_argument('--roi', type=int, nargs=4, metavar=('X', 'Y', 'W', 'H'), help='Crop stored pairs to this ROI.')
+    sample_parser.add_argument('--frame_step', type=int, default=1, help='Frames between the two frames of a pair. Default: 1.')
+    sample_parser.add_argument('--downscale', type=int, default=1,
+                               help='Store pairs shrunk by this factor (as --downscale in processing). Default: 1.')
+    sample_parser.add_argument('--seed', type=int, default=0, help='Random seed for the sampled frames. Default: 0.')
+
+    sweep_parser = subparsers.add_parser('sweep', help='Evaluate a threshold grid against a corpus file.')
+    sweep_parser.add_argument('--corpus', type=str, required=True, help='Corpus file written by sample.')
+    sweep_parser.add_argument('--output', type=str, required=True, help='Results CSV, one row per parameter set.')
+    preset = MOVEMENT_PRESETS['most_movement']
+    sweep_parser.add_argument('--global_thresholds', type=float, nargs='+', default=[10.0, 15.0, 20.0, 30.0, 40.0],
+                              help=f"Default: 10 15 20 30 40 (most_movement uses {preset['global_threshold']}).")
+    sweep_parser.add_argument('--percentage_thresholds', type=float, nargs='+', default=[15.0, 25.0, 35.0, 50.0],
+                              help=f"Default: 15 25 35 50 (most_movement uses {preset['percentage_threshold']}).")
+    sweep_parser.add_argument('--min_size_thresholds', type=float, nargs='+', default=[40.0, 80.0, 120.0, 160.0, 200.0],
+                              help=f"Default: 40 80 120 160 200 (most_movement uses {preset['min_size_threshold']}).")
+    sweep_parser.add_argument('--dilation_kernels', type=int, nargs='+', default=[0, 2, 3, 4],
+                              help=f"Default: 0 2 3 4 (most_movement uses {preset['dilation_kernel']}).")
+    sweep_parser.add_argument('--workers', type=int, default=int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count())),
+                              help='Worker processes. Default: SLURM_CPUS_PER_TASK, else all cores.')
+    args = parser.parse_args(argv)
+
+    if args.command == 'sample':
+        if not args.video_file and not args.video_folder:
+            print("Please provide either a video file or a video folder.")
+            return 1
+        if args.frame_step < 1 or args.downscale < 1:
+            print("--frame_step and --downscale must be at least 1.")
+            return 1
+        video_file_paths = _video_paths(args.video_file, args.video_folder)
+        try:
+            labels = read_labels(args.labels) if args.labels else None
+            if labels:
+                check_label_videos(labels, video_file_paths)
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Invalid --labels file: {e}")
+            return 1
+        root = args.video_folder if not args.video_file else os.path.dirname(os.path.abspath(args.video_file))
+        stored = sample_corpus(video_file_paths, args.output, args.pairs_per_video, args.frame_step,
+                               tuple(args.roi) if args.roi else None, args.downscale, labels, args.seed, root)
+        return 0 if stored else 1
+
+    parameter_grid = itertools.product(args.global_thresholds, args.percentage_thresholds,
+                                       args.min_size_thresholds, args.dilation_kernels)
+    rows = sweep_corpus(args.corpus, parameter_grid, args.output, max(1, args.workers))
+    ranked = [row for row in rows if row['Accuracy'] != '']
+    if ranked:
+        print("Best agreement with the labels (global/percentage/min size/dilation):")
+        for row in sorted(ranked, key=lambda row: (-row['Accuracy'], row['FalsePositiveRate'] or 0))[:5]:
+            print(f"  {row['GlobalThreshold']}/{row['PercentageThreshold']}/{row['MinSizeThreshold']}/{row['DilationKernel']}: "
+                  f"accuracy {row['Accuracy']}, true positive rate {row['TruePositiveRate']}, "
+                  f"false positive rate {row['FalsePositiveRate']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,155 +1,155 @@
 import sys
 import cv2
-import numpy as np
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, QFileDialog
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, QFileDialog, QSlider
+from PyQt5.QtCore import QTimer, Qt
 from PyQt5.QtGui import QImage, QPixmap
-
-class VideoThread(QThread):
-    change_pixmap_signal = pyqtSignal(np.ndarray)
-
-    def __init__(self, video_path, global_threshold, percentage_threshold, min_size_threshold, dilation_kernel, speed_option):
-        super().__init__()
-        self.video_path = video_path
-        self.min_size_threshold = min_size_threshold
-        self.global_threshold = global_threshold
-        self.percentage_threshold = percentage_threshold
-        self.dilation_kernel = dilation_kernel
-        self.speed_option = speed_option
-        self.speed_options_mapping = {"Slow": 100, "Normal": 30, "Fast": 10, "Very Fast": 1}
-        self.is_running = True
-
-    def stop(self):
-        self.is_running = False
-
-    def calculate_metrics(self, frame, prev_frame):
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        prev_frame = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)    
-        	
-        abs_diff = np.abs(frame - prev_frame)
-        raw_diff = np.sum(abs_diff)
-        rmse = (np.mean((frame - prev_frame) ** 2))**0.5
-        
-        
-        #mean_diff = np.mean(abs_diff)
-        #dynamic_threshold = mean_diff * (1 + global_threshold / 100.0)
-        
-        prev_frame_safe = prev_frame.astype(np.float32) + 1e-5
-        frame = frame.astype(np.float32)
-	    
-	     # Calculate absolute difference and percentage change
-        abs_diff = np.abs(frame - prev_frame)
-        percentage_change = np.abs((frame - prev_frame_safe) / prev_frame_safe)
-	    
-	     # Scale percentage change to 0-100 (adjust scaling factor as needed)
-        percentage_change_scaled = np.clip(percentage_change * 100, 0, 100).astype(np.uint8)
-	    
-	     # Apply thresholds to get binary masks
-        _, abs_diff_mask = cv2.threshold(abs_diff, self.global_threshold, 255, cv2.THRESH_BINARY)
-        _, percentage_change_mask = cv2.threshold(percentage_change_scaled, self.percentage_threshold, 100, cv2.THRESH_BINARY)
-        abs_diff_mask = abs_diff_mask.astype(np.uint8)
-        percentage_change_mask = percentage_change_mask.astype(np.uint8)
-
-	     # Combine masks using logical AND to require both conditions to be met
-        combined_mask = cv2.bitwise_and(abs_diff_mask, percentage_change_mask)
-        
-        
-        kernel = np.ones((self.dilation_kernel, self.dilation_kernel), np.uint8)
-        dilated_diff = cv2.dilate(combined_mask, kernel, iterations=1)
-        dilated_diff = dilated_diff.astype(np.uint8)
-        dilated_diff_filtered = self.filter_small_regions(dilated_diff, self.min_size_threshold)
-        selected_pixel_diff = np.sum(dilated_diff_filtered)
-        return raw_diff, rmse, selected_pixel_diff, dilated_diff_filtered
-
-    def filter_small_regions(self, binary_image, min_size):
-        #binary_image_single_channel = cv2.cvtColor(binary_image, cv2.COLOR_BGR2GRAY)
-        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(binary_image, connectivity=8)
-        filtered_image = np.zeros_like(binary_image)
-        for label in range(1, num_labels):
-            if stats[label, cv2.CC_STAT_AREA] >= min_size:
-                filtered_image[labels == label] = 255
-        return filtered_image
-
-    def run(self):
-        cap = cv2.VideoCapture(self.video_path)
-        prev_frame = None
-        frame_delay = self.speed_options_mapping.get(self.speed_option, 30)
-
-        while self.is_running:
-            ret, frame = cap.read()
-            if not ret or not self.is_running:
-                break
-            if prev_frame is not None:
-                raw_diff, rmse, selected_pixel_diff, dilated_diff_filtered = self.calculate_metrics(frame, prev_frame)
-                frame_highlighted = np.copy(frame)
-                frame_highlighted[dilated_diff_filtered > 0] = [0, 255, 0]
-                self.change_pixmap_signal.emit(frame_highlighted)
-            prev_frame = frame
-            cv2.waitKey(frame_delay)
-
-        cap.release()
+from actigraphy.preview import PreviewEngine
 
 class VideoAnalyzerApp(QWidget):
+    # Frames come from a PreviewEngine (decoded ahead into a cache), so playback, scrubbing and threshold edits
+    # only ever compute the one displayed frame pair
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Video Analyzer")
         self.video_path = ""
-        self.thread = None
+        self.engine = None
+        self.frame_index = 0
+        self.speed_options_mapping = {"Slow": 100, "Normal": 30, "Fast": 10, "Very Fast": 1} # ms between frames
+        self.play_timer = QTimer(self)
+        self.play_timer.timeout.connect(self.next_frame)
         self.initUI()
 
     def initUI(self):
-	    self.layout = QVBoxLayout()
-	    self.image_label = QLabel(self)
-	    self.layout.addWidget(self.image_label)
-	
-	    # Creating a function to add entries with labels for cleaner code
-	    def add_entry_with_label(layout, label_text, default_value=""):
-	        entry_layout = QVBoxLayout()
-	        entry = QLineEdit(default_value)
-	        label = QLabel(label_text)
-	        entry_layout.addWidget(entry)
-	        entry_layout.addWidget(label)
-	        layout.addLayout(entry_layout)
-	        return entry
-	
-	    controls_layout = QHBoxLayout()
-	
-	    # Adding video path entry
-	    self.video_path_entry = QLineEdit()
-	    controls_layout.addWidget(self.video_path_entry)
-	    self.browse_button = QPushButton("Browse")
-	    self.browse_button.clicked.connect(self.browse_video)
-	    controls_layout.addWidget(self.browse_button)
-	
-	    # Adding entries with labels
-	    self.global_threshold_entry = add_entry_with_label(controls_layout, "Global Threshold", "15")
-	    self.percentage_threshold_entry = add_entry_with_label(controls_layout, "Percentage Threshold", "25")
-	    self.min_size_entry = add_entry_with_label(controls_layout, "Min Size", "120")
-	    self.kernel_entry = add_entry_with_label(controls_layout, "Kernel Size", "4")
-	
-	    # Speed selection
-	    self.speed_var = QComboBox()
-	    self.speed_var.addItems(["Slow", "Normal", "Fast", "Very Fast"])
-	    controls_layout.addWidget(self.speed_var)
-	
-	    # Run and Stop buttons
-	    self.run_button = QPushButton("Run Analysis")
-	    self.run_button.clicked.connect(self.run_analysis)
-	    controls_layout.addWidget(self.run_button)
-	
-	    self.stop_button = QPushButton("Stop Analysis")
-	    self.stop_button.clicked.connect(self.stop_analysis)
-	    controls_layout.addWidget(self.stop_button)
-	
-	    self.layout.addLayout(controls_layout)
-	    self.setLayout(self.layout)
-
+        self.layout = QVBoxLayout()
+        self.image_label = QLabel(self)
+        self.layout.addWidget(self.image_label)
+
+        # Scrub bar and position, in frames of the video
+        self.position_slider = QSlider(Qt.Horizontal)
+        self.position_slider.setEnabled(False)
+        self.position_slider.valueChanged.connect(self.seek_frame)
+        self.layout.addWidget(self.position_slider)
+        self.position_label = QLabel("No video loaded")
+        self.layout.addWidget(self.position_label)
+
+        # Creating a function to add entries with labels for cleaner code
+        def add_entry_with_label(layout, label_text, default_value=""):
+            entry_layout = QVBoxLayout()
+            entry = QLineEdit(default_value)
+            label = QLabel(label_text)
+            entry_layout.addWidget(entry)
+            entry_layout.addWidget(label)
+            layout.addLayout(entry_layout)
+            return entry
+
+        controls_layout = QHBoxLayout()
+
+        # Adding video path entry
+        self.video_path_entry = QLineEdit()
+        controls_layout.addWidget(self.video_path_entry)
+        self.browse_button = QPushButton("Browse")
+        self.browse_button.clicked.connect(self.browse_video)
+        controls_layout.addWidget(self.browse_button)
+
+        # Adding entries with labels; editing one redraws the current frame pair
+        self.global_threshold_entry = add_entry_with_label(controls_layout, "Global Threshold", "15")
+        self.percentage_threshold_entry = add_entry_with_label(controls_layout, "Percentage Threshold", "25")
+        self.min_size_entry = add_entry_with_label(controls_layout, "Min Size", "120")
+        self.kernel_entry = add_entry_with_label(controls_layout, "Kernel Size", "4")
+        for entry in (self.global_threshold_entry, self.percentage_threshold_entry, self.min_size_entry, self.kernel_entry):
+            entry.editingFinished.connect(self.show_frame)
+
+        # Jump to a time (HH:MM:SS or seconds)
+        self.goto_entry = add_entry_with_label(controls_layout, "Go to (HH:MM:SS)", "00:00:00")
+        self.goto_entry.returnPressed.connect(self.goto_time)
+
+        # Speed selection
+        self.speed_var = QComboBox()
+        self.speed_var.addItems(["Slow", "Normal", "Fast", "Very Fast"])
+        self.speed_var.setCurrentText("Normal")
+        self.speed_var.currentTextChanged.connect(self.update_speed)
+        controls_layout.addWidget(self.speed_var)
+
+        # Run and Stop buttons
+        self.run_button = QPushButton("Run Analysis")
+        self.run_button.clicked.connect(self.run_analysis)
+        controls_layout.addWidget(self.run_button)
+
+        self.stop_button = QPushButton("Stop Analysis")
+        self.stop_button.clicked.connect(self.stop_analysis)
+        controls_layout.addWidget(self.stop_button)
+
+        self.layout.addLayout(controls_layout)
+        self.setLayout(self.layout)
 
     def browse_video(self):
         video_path, _ = QFileDialog.getOpenFileName(self, "Select Video", "", "*.mp4")
         if video_path:
             self.video_path_entry.setText(video_path)
             self.video_path = video_path
+            self.open_video()
+
+    def open_video(self):
+        self.stop_analysis()
+        if self.engine is not None:
+            self.engine.close()
+        self.video_path = self.video_path_entry.text()
+        self.engine = PreviewEngine(self.video_path, preview_width=max(320, self.image_label.width()))
+        if not self.engine.isOpened():
+            self.position_label.setText(f"Could not open {self.video_path}")
+            self.engine = None
+            return
+        self.position_slider.blockSignals(True)
+        self.position_slider.setRange(0, max(0, self.engine.frame_count - 1))
+        self.position_slider.setValue(0)
+        self.position_slider.blockSignals(False)
+        self.position_slider.setEnabled(True)
+        self.frame_index = 0
+        self.show_frame()
+
+    def thresholds(self):
+        # (global, percentage, min size, dilation), or None while an entry does not hold a number
+        try:
+            return (float(self.global_threshold_entry.text()), float(self.percentage_threshold_entry.text()),
+                    float(self.min_size_entry.text()), int(self.kernel_entry.text()))
+        except ValueError:
+            return None
+
+    def show_frame(self):
+        thresholds = self.thresholds()
+        if self.engine is None or thresholds is None:
+            return
+        rendered = self.engine.render(self.frame_index, *thresholds)
+        if rendered is None: # Past the last readable frame
+            self.stop_analysis()
+            return
+        overlay, (raw_diff, rmse, selected_pixel_diff) = rendered
+        self.update_image(overlay)
+        seconds = self.engine.seconds_at(self.frame_index)
+        self.position_label.setText(
+            f"Frame {self.frame_index + 1} of {self.engine.frame_count}  "
+            f"{int(seconds // 3600):02d}:{int(seconds % 3600 // 60):02d}:{seconds % 60:06.3f}  "
+            f"RawDifference {raw_diff:.0f}  RMSE {rmse:.2f}  SelectedPixelDifference {selected_pixel_diff}")
+
+    def seek_frame(self, frame_index):
+        self.frame_index = frame_index
+        self.show_frame()
+
+    def goto_time(self):
+        if self.engine is None:
+            return
+        try:
+            seconds = sum(float(part) * 60 ** power
+                          for power, part in enumerate(reversed(self.goto_entry.text().strip().split(':'))))
+        except ValueError:
+            return
+        self.position_slider.setValue(self.engine.index_at(seconds)) # Redraws through seek_frame
+
+    def next_frame(self):
+        if self.engine is None or self.frame_index + 1 >= self.engine.frame_count:
+            self.stop_analysis()
+            return
+        self.position_slider.setValue(self.frame_index + 1)
 
     def update_image(self, cv_img):
         qt_img = self.convert_cv_qt(cv_img)
@@ -163,23 +163,26 @@ class VideoAnalyzerApp(QWidget):
         qt_img = QPixmap.fromImage(convert_to_qt_format).scaled(self.image_label.width(), self.image_label.height(), Qt.KeepAspectRatio)
         return qt_img
 
+    def update_speed(self, speed_option):
+        self.play_timer.setInterval(self.speed_options_mapping.get(speed_option, 30))
+
     def run_analysis(self):
-        if self.thread is not None and self.thread.isRunning():
-            self.thread.stop()
-        min_size_threshold = int(self.min_size_entry.text())
-        global_threshold = int(self.global_threshold_entry.text())
-        percentage_threshold = int(self.percentage_threshold_entry.text())
-        dilation_kernel = int(self.kernel_entry.text())
-        speed_option = self.speed_var.currentText()
-        self.thread = VideoThread(self.video_path, global_threshold, percentage_threshold, min_size_threshold, dilation_kernel, speed_option)
-        self.thread.change_pixmap_signal.connect(self.update_image)
-        self.thread.start()
+        # Plays from the current position (scrub or Go to first to start elsewhere)
+        if self.engine is None or self.video_path != self.video_path_entry.text():
+            self.open_video()
+        if self.engine is None:
+            return
+        self.update_speed(self.speed_var.currentText())
+        self.play_timer.start()
 
     def stop_analysis(self):
-        if self.thread is not None:
-            self.thread.stop()
-            self.thread.wait()  # Ensure the thread has finished
-            self.image_label.clear()  # Clear the image display
+        self.play_timer.stop()
+
+    def closeEvent(self, event):
+        self.stop_analysis()
+        if self.engine is not None:
+            self.engine.close()
+        super().closeEvent(event)
 
 def main():
     app = QApplication(sys.argv)
@@ -188,4 +191,4 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()